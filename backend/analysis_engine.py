@@ -7,16 +7,87 @@ import logging
 import json
 import re
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
 from dataclasses import dataclass
-from collections import defaultdict
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
+import bisect
+import hashlib
 import ipaddress
+import threading
 import dns.resolver
 import dns.exception
+from cachetools import TTLCache
 from supabase import Client
 
 logger = logging.getLogger(__name__)
 
+# SPF parsing patterns, compiled once and shared by every analysis.
+# _SPF_TOKEN_RE matches whole mechanism/modifier terms with their optional argument.
+_SPF_TOKEN_RE = re.compile(
+    r'(?<!\S)[+\-~?]?(?P<mech>a|mx|ptr|ip4|ip6|include|exists|redirect)(?:[:=](?P<arg>\S+))?(?=[\s/]|$)'
+)
+_SPF_LOOKUP_MECHANISMS = frozenset(('a', 'mx', 'ptr', 'include', 'exists', 'redirect'))
+_SPF_IPNET_RE = re.compile(r'(ip4|ip6):(\S+)')
+_SPF_ALL_RE = re.compile(r'(?<!\S)[-+~?]?all(?!\S)')
+
+_SPF_NETWORK_TYPES = {'ip4': (4, ipaddress.IPv4Network), 'ip6': (6, ipaddress.IPv6Network)}
+
+@lru_cache(maxsize=1024)
+def _parse_spf_networks(spf_record: str) -> Dict[int, Tuple[List[int], List[int]]]:
+    """Parse the ip4/ip6 terms of an SPF record into sorted, disjoint (starts, ends) ranges per IP version"""
+    networks = {4: [], 6: []}
+    for family, mechanism in _SPF_IPNET_RE.findall(spf_record):
+        # The mechanism prefix fixes the address family, so only that network type is tried
+        version, network_type = _SPF_NETWORK_TYPES[family]
+        try:
+            networks[version].append(network_type(mechanism, strict=False))
+        except ValueError:
+            continue
+    
+    # Collapsing merges overlapping/adjacent networks, so at most one range can contain an address
+    ranges = {}
+    for version, nets in networks.items():
+        collapsed = list(ipaddress.collapse_addresses(nets))
+        ranges[version] = (
+            [int(net.network_address) for net in collapsed],
+            [int(net.broadcast_address) for net in collapsed]
+        )
+    return ranges
+
+# dmarc_records columns the analysis reads; rows are unpacked into tuples in this order
+# once on fetch so the aggregation loop does no per-field dict lookups
+_RECORD_FIELDS = ('count', 'source_ip', 'spf_result', 'dkim_result', 'dkim_domain', 'dkim_selector')
+_record_row = itemgetter(*_RECORD_FIELDS)
+
+# Rows per records page; matches PostgREST's default max-rows so no page is silently truncated
+_RECORDS_PAGE_SIZE = 1000
+
+# Index into the [valid, invalid, missing] DKIM signature tallies; anything else is missing
+_DKIM_TALLY_INDEX = {'pass': 0, 'fail': 1}
+
+# Process-wide SPF lookup cache; analyzers are created per request so an instance cache
+# never outlived a single analysis. Negative answers (NXDOMAIN, no TXT records) are cached too.
+_DNS_CACHE = TTLCache(maxsize=10000, ttl=900)
+# Transient lookup failures (timeouts, SERVFAIL) are only remembered briefly, so a DNS hiccup
+# doesn't read as a missing SPF record for the full TTL
+_DNS_ERROR_CACHE = TTLCache(maxsize=10000, ttl=60)
+_DNS_LOCK = threading.Lock()
+
+# Shared resolver with a bounded lifetime so a slow nameserver can't stall an analysis
+_RESOLVER = dns.resolver.Resolver(configure=True)
+_RESOLVER.lifetime = 2.0
+
+# Completed analyses keyed by user, domain, window and a digest of the report IDs they
+# covered; a new report changes the digest, and the TTL bounds staleness of SPF data
+_ANALYSIS_CACHE = TTLCache(maxsize=1024, ttl=900)
+_ANALYSIS_LOCK = threading.Lock()
+
+# Shared pool for overlapping the Supabase and DNS round-trips of an analysis
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=10, thread_name_prefix='dmarc-analysis')
+
 @dataclass
 class AnalysisResult:
     domain: str
@@ -55,7 +126,6 @@ class DMARCAnalyzer:
     
     def __init__(self, supabase: Client):
         self.supabase = supabase
-        self.dns_cache = {}  # Simple DNS caching to avoid repeated lookups
         
         # Known mail service provider IP ranges
         self.known_providers = {
@@ -78,6 +148,30 @@ class DMARCAnalyzer:
                 '69.72.34.0/24'
             ]
         }
+        
+        # Sorted CIDR tables for binary-search provider lookups, plus per-IP memoization
+        # since the same source IPs repeat across many records
+        self._provider_ranges = self._build_provider_ranges()
+        self._provider_cache: Dict[str, Optional[str]] = {}
+    
+    def _build_provider_ranges(self) -> Dict[int, Tuple[List[int], List[Tuple[int, int, str]]]]:
+        """Flatten known_providers into per-IP-version tables sorted by network start"""
+        ranges = {4: [], 6: []}
+        for provider, cidrs in self.known_providers.items():
+            for cidr in cidrs:
+                try:
+                    network = ipaddress.ip_network(cidr, strict=False)
+                except ValueError:
+                    continue
+                ranges[network.version].append(
+                    (int(network.network_address), int(network.broadcast_address), provider)
+                )
+        
+        tables = {}
+        for version, entries in ranges.items():
+            entries.sort()
+            tables[version] = ([start for start, _, _ in entries], entries)
+        return tables
     
     def analyze_domain_reports(self, user_id: str, domain: str, days: int = 30) -> AnalysisResult:
         """
@@ -86,9 +180,12 @@ class DMARCAnalyzer:
         logger.info(f"Starting AI analysis for domain: {domain}, user: {user_id}")
         
         try:
-            # Get recent DMARC reports
-            reports = self._get_recent_reports(user_id, domain, days)
-            if not reports:
+            # The SPF TXT lookup is independent of the database queries, so run it concurrently
+            spf_future = _IO_EXECUTOR.submit(self._get_spf_record, domain)
+            
+            # Get report totals for the window as a single aggregate row
+            totals = self._get_report_totals(user_id, domain, days)
+            if not totals['report_count']:
                 return AnalysisResult(
                     domain=domain,
                     health_score=0,
@@ -99,18 +196,33 @@ class DMARCAnalyzer:
                     status="no_data"
                 )
             
-            # Get detailed records for analysis
-            records = self._get_detailed_records(user_id, domain, days)
+            # Reports are immutable once ingested, so an unchanged report set means an unchanged result
+            cache_key = (user_id, domain, days, totals['reports_hash'])
+            with _ANALYSIS_LOCK:
+                cached = _ANALYSIS_CACHE.get(cache_key)
+            if cached is not None:
+                logger.debug(f"Analysis cache hit for {domain}")
+                return cached
+            
+            # Alignment mismatches are aggregated in the database alongside the records fetch
+            alignment_future = _IO_EXECUTOR.submit(self._get_alignment_mismatches, user_id, domain, days)
+            
+            # Stream the detailed records page by page, collecting every per-record tally in
+            # one pass without holding the rows, then derive the analyses from the tallies
+            aggregates = self._aggregate_records(self._iter_records(user_id, domain, days))
+            
+            # Wait for the SPF lookup so _analyze_spf_failures reads it from the DNS cache
+            spf_future.result()
             
             # Perform various analyses
-            spf_analysis = self._analyze_spf_failures(domain, records)
-            dkim_analysis = self._analyze_dkim_failures(domain, records)
-            pattern_analysis = self._analyze_failure_patterns(records)
-            provider_analysis = self._analyze_mail_providers(records)
+            spf_analysis = self._analyze_spf_failures(domain, aggregates)
+            dkim_analysis = self._analyze_dkim_failures(domain, aggregates)
+            pattern_analysis = self._analyze_failure_patterns(aggregates)
+            provider_analysis = self._analyze_mail_providers(aggregates)
             
             # Calculate metrics
-            total_records = sum(r['total_records'] for r in reports)
-            total_failures = sum(r['fail_count'] for r in reports)
+            total_records = totals['total_records']
+            total_failures = totals['total_failures']
             failure_rate = (total_failures / total_records * 100) if total_records > 0 else 0
             
             # Detect anomalies and issues
@@ -118,7 +230,7 @@ class DMARCAnalyzer:
             issues.extend(self._detect_spf_issues(spf_analysis, provider_analysis))
             issues.extend(self._detect_dkim_issues(dkim_analysis))
             issues.extend(self._detect_pattern_anomalies(pattern_analysis))
-            issues.extend(self._detect_alignment_issues(records))
+            issues.extend(self._detect_alignment_issues(alignment_future.result()))
             
             # Calculate health score
             health_score = self._calculate_health_score(failure_rate, issues, spf_analysis, dkim_analysis)
@@ -140,6 +252,13 @@ class DMARCAnalyzer:
                 status=status
             )
             
+            # A result built on a failed SPF lookup is served once but not cached
+            with _DNS_LOCK:
+                spf_lookup_failed = domain in _DNS_ERROR_CACHE
+            if not spf_lookup_failed:
+                with _ANALYSIS_LOCK:
+                    _ANALYSIS_CACHE[cache_key] = result
+            
             logger.info(f"Analysis completed for {domain}: Health Score {health_score}, Failure Rate {failure_rate:.2f}%")
             return result
             
@@ -155,38 +274,151 @@ class DMARCAnalyzer:
                 status="error"
             )
     
-    def _get_recent_reports(self, user_id: str, domain: str, days: int) -> List[Dict[str, Any]]:
-        """Get recent DMARC reports for analysis"""
+    def analyze_domains_batch(self, user_id: str, domains: List[str], days: int = 30) -> Dict[str, AnalysisResult]:
+        """
+        Analyze several domains, resolving their SPF records concurrently up front
+        """
+        domains = list(dict.fromkeys(domains))
+        if not domains:
+            return {}
+        
+        # TXT lookups are network-bound and independent, so warm the shared DNS cache
+        # in parallel; each analysis below then reads its SPF record from memory
+        with ThreadPoolExecutor(max_workers=min(32, len(domains))) as executor:
+            list(executor.map(self._get_spf_record, domains))
+        
+        return {domain: self.analyze_domain_reports(user_id, domain, days) for domain in domains}
+    
+    def _get_report_totals(self, user_id: str, domain: str, days: int) -> Dict[str, Any]:
+        """Get report count, record/failure totals and a digest of the report IDs in the window"""
         cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         
+        try:
+            result = self.supabase.rpc('dmarc_report_totals', {
+                'p_user_id': user_id,
+                'p_domain': domain,
+                'p_cutoff': cutoff_date
+            }).execute()
+            if result.data:
+                return result.data[0]
+        except Exception as e:
+            logger.warning(f"Report totals RPC failed for {domain}, summing reports instead: {str(e)}")
+        
+        # Fallback for databases without the RPC: fetch the reports and aggregate here
         result = self.supabase.table('dmarc_reports').select(
-            'id,org_name,domain,total_records,pass_count,fail_count,date_range_begin,date_range_end,created_at'
+            'id,total_records,fail_count'
         ).eq('user_id', user_id).eq('domain', domain).gte('created_at', cutoff_date).execute()
+        reports = result.data if result.data else []
+        
+        report_ids = sorted(str(report['id']) for report in reports)
+        return {
+            'report_count': len(reports),
+            'total_records': sum(report['total_records'] for report in reports),
+            'total_failures': sum(report['fail_count'] for report in reports),
+            'reports_hash': hashlib.blake2b(','.join(report_ids).encode(), digest_size=16).hexdigest()
+        }
+    
+    def _get_records_page(self, user_id: str, domain: str, cutoff_date: str, offset: int) -> List[Dict[str, Any]]:
+        """Get one page of detailed DMARC records for analysis"""
+        # Filter records through an inner join on their parent report so a single
+        # round-trip replaces the report-ID lookup followed by an IN (...) query
+        records_result = self.supabase.table('dmarc_records').select(
+            ','.join(_RECORD_FIELDS) + ',dmarc_reports!inner()'
+        ).eq('dmarc_reports.user_id', user_id).eq('dmarc_reports.domain', domain).gte(
+            'dmarc_reports.created_at', cutoff_date
+        ).order('id').range(offset, offset + _RECORDS_PAGE_SIZE - 1).execute()
         
-        return result.data if result.data else []
+        return records_result.data if records_result.data else []
     
-    def _get_detailed_records(self, user_id: str, domain: str, days: int) -> List[Dict[str, Any]]:
-        """Get detailed DMARC records for analysis"""
+    def _iter_records(self, user_id: str, domain: str, days: int) -> Iterator[Tuple]:
+        """Yield detailed DMARC records as _RECORD_FIELDS tuples, prefetching the next page"""
         cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         
-        # Get report IDs first
-        reports_result = self.supabase.table('dmarc_reports').select('id').eq(
-            'user_id', user_id
-        ).eq('domain', domain).gte('created_at', cutoff_date).execute()
+        offset = 0
+        page = self._get_records_page(user_id, domain, cutoff_date, offset)
+        while page:
+            next_future = None
+            if len(page) == _RECORDS_PAGE_SIZE:
+                offset += _RECORDS_PAGE_SIZE
+                next_future = _IO_EXECUTOR.submit(self._get_records_page, user_id, domain, cutoff_date, offset)
+            
+            yield from map(_record_row, page)
+            
+            page = next_future.result() if next_future else []
+    
+    def _get_alignment_mismatches(self, user_id: str, domain: str, days: int) -> List[Dict[str, Any]]:
+        """Get the most frequent header/envelope From mismatches via the alignment RPC"""
+        cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         
-        if not reports_result.data:
+        try:
+            result = self.supabase.rpc('dmarc_alignment_mismatches', {
+                'p_user_id': user_id,
+                'p_domain': domain,
+                'p_cutoff': cutoff_date
+            }).execute()
+            return result.data if result.data else []
+        except Exception as e:
+            logger.warning(f"Alignment mismatch lookup failed for {domain}: {str(e)}")
             return []
+    
+    def _aggregate_records(self, records: Iterable[Tuple]) -> Dict[str, Any]:
+        """Single pass over the records collecting the SPF, DKIM, failure-pattern
+        and provider tallies used by the individual analyses"""
+        ip_to_provider = {}  # each distinct source IP is resolved to a provider once
+        spf_failing_ips = {}  # insertion-ordered set of IPs failing SPF
+        dkim_domains = set()
+        dkim_selectors = set()
+        dkim_tallies = [0, 0, 0]  # valid, invalid, missing
+        ip_failures = Counter()
+        provider_failures = Counter()
+        provider_total, provider_pass, provider_fail = Counter(), Counter(), Counter()
+        
+        for count, source_ip, spf_result, dkim_result, dkim_domain, dkim_selector in records:
+            if source_ip in ip_to_provider:
+                provider = ip_to_provider[source_ip]
+            else:
+                provider = ip_to_provider[source_ip] = self._identify_mail_provider(source_ip)
+            
+            if spf_result == 'fail' and count > 0 and source_ip:
+                spf_failing_ips[source_ip] = None
+            
+            if dkim_domain:
+                dkim_domains.add(dkim_domain)
+            if dkim_selector:
+                dkim_selectors.add(dkim_selector)
+            
+            dkim_tallies[_DKIM_TALLY_INDEX.get(dkim_result, 2)] += count
+            
+            if spf_result == 'fail' or dkim_result == 'fail':
+                ip_failures[source_ip] += count
+                if provider:
+                    provider_failures[provider] += count
+            
+            provider_key = provider or 'unknown'
+            provider_total[provider_key] += count
+            if spf_result == 'pass' or dkim_result == 'pass':
+                provider_pass[provider_key] += count
+            else:
+                provider_fail[provider_key] += count
         
-        report_ids = [r['id'] for r in reports_result.data]
-        
-        # Get detailed records
-        records_result = self.supabase.table('dmarc_records').select('*').in_(
-            'dmarc_report_id', report_ids
-        ).execute()
+        valid_signatures, invalid_signatures, missing_signatures = dkim_tallies
         
-        return records_result.data if records_result.data else []
+        return {
+            'ip_to_provider': ip_to_provider,
+            'spf_failing_ips': list(spf_failing_ips),
+            'dkim_domains': dkim_domains,
+            'dkim_selectors': dkim_selectors,
+            'valid_signatures': valid_signatures,
+            'invalid_signatures': invalid_signatures,
+            'missing_signatures': missing_signatures,
+            'ip_failures': ip_failures,
+            'provider_failures': provider_failures,
+            'provider_total': provider_total,
+            'provider_pass': provider_pass,
+            'provider_fail': provider_fail
+        }
     
-    def _analyze_spf_failures(self, domain: str, records: List[Dict[str, Any]]) -> SPFAnalysis:
+    def _analyze_spf_failures(self, domain: str, aggregates: Dict[str, Any]) -> SPFAnalysis:
         """Analyze SPF failures and configuration"""
         logger.debug(f"Analyzing SPF for domain: {domain}")
         
@@ -196,36 +428,37 @@ class DMARCAnalyzer:
         # Parse SPF record
         mechanisms = []
         includes = []
+        redirects = []
         lookup_count = 0
         issues = []
         
         if spf_record:
-            mechanisms = re.findall(r'[+-~?]?(a|mx|ip4|ip6|include|exists|redirect)', spf_record)
-            includes = re.findall(r'include:([^\s]+)', spf_record)
-            lookup_count = len(includes) + spf_record.count(' mx') + spf_record.count(' a')
+            # Single tokenizing pass classifies every term and counts DNS-querying ones
+            for match in _SPF_TOKEN_RE.finditer(spf_record):
+                mech = match.group('mech')
+                mechanisms.append(mech)
+                if mech == 'include':
+                    includes.append(match.group('arg'))
+                elif mech == 'redirect':
+                    redirects.append(match.group('arg'))
+                if mech in _SPF_LOOKUP_MECHANISMS:
+                    lookup_count += 1
             
             if lookup_count > 10:
                 issues.append("SPF record exceeds 10 DNS lookup limit")
             if not spf_record.startswith('v=spf1'):
                 issues.append("SPF record doesn't start with 'v=spf1'")
-            if not any(term in spf_record for term in ['~all', '-all', '+all', '?all']):
+            if not _SPF_ALL_RE.search(spf_record):
                 issues.append("SPF record missing 'all' mechanism")
         else:
             issues.append("No SPF record found")
         
-        # Find IPs failing SPF that should be authorized
-        failing_ips = []
-        for record in records:
-            if record.get('spf_result') == 'fail' and record.get('count', 0) > 0:
-                source_ip = record.get('source_ip')
-                if source_ip and source_ip not in failing_ips:
-                    failing_ips.append(source_ip)
-        
-        # Check which failing IPs should be authorized
+        # Check which IPs failing SPF should be authorized
         missing_ips = []
-        for ip in failing_ips:
+        ip_to_provider = aggregates['ip_to_provider']
+        for ip in aggregates['spf_failing_ips']:
             if not self._ip_authorized_by_spf(ip, spf_record):
-                provider = self._identify_mail_provider(ip)
+                provider = ip_to_provider.get(ip)
                 if provider:
                     missing_ips.append(f"{ip} ({provider})")
                 else:
@@ -236,40 +469,21 @@ class DMARCAnalyzer:
             is_valid=bool(spf_record and not issues),
             mechanisms=mechanisms,
             includes=includes,
+            redirects=redirects,
             lookup_count=lookup_count,
             issues=issues,
             missing_ips=missing_ips
         )
     
-    def _analyze_dkim_failures(self, domain: str, records: List[Dict[str, Any]]) -> DKIMAnalysis:
+    def _analyze_dkim_failures(self, domain: str, aggregates: Dict[str, Any]) -> DKIMAnalysis:
         """Analyze DKIM failures and configuration"""
         logger.debug(f"Analyzing DKIM for domain: {domain}")
         
-        dkim_domains = set()
-        dkim_selectors = set()
-        valid_signatures = 0
-        invalid_signatures = 0
-        missing_signatures = 0
+        valid_signatures = aggregates['valid_signatures']
+        invalid_signatures = aggregates['invalid_signatures']
+        missing_signatures = aggregates['missing_signatures']
         issues = []
         
-        for record in records:
-            count = record.get('count', 0)
-            dkim_result = record.get('dkim_result')
-            dkim_domain = record.get('dkim_domain')
-            dkim_selector = record.get('dkim_selector')
-            
-            if dkim_domain:
-                dkim_domains.add(dkim_domain)
-            if dkim_selector:
-                dkim_selectors.add(dkim_selector)
-            
-            if dkim_result == 'pass':
-                valid_signatures += count
-            elif dkim_result == 'fail':
-                invalid_signatures += count
-            else:
-                missing_signatures += count
-        
         # Check for common DKIM issues
         total_messages = valid_signatures + invalid_signatures + missing_signatures
         if total_messages > 0:
@@ -282,54 +496,32 @@ class DMARCAnalyzer:
                 issues.append(f"Many messages without DKIM signatures: {missing_rate:.1f}%")
         
         return DKIMAnalysis(
-            domains=list(dkim_domains),
-            selectors=list(dkim_selectors),
+            domains=list(aggregates['dkim_domains']),
+            selectors=list(aggregates['dkim_selectors']),
             valid_signatures=valid_signatures,
             invalid_signatures=invalid_signatures,
             missing_signatures=missing_signatures,
             issues=issues
         )
     
-    def _analyze_failure_patterns(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _analyze_failure_patterns(self, aggregates: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze patterns in DMARC failures"""
-        ip_failures = defaultdict(int)
-        provider_failures = defaultdict(int)
-        
-        for record in records:
-            count = record.get('count', 0)
-            source_ip = record.get('source_ip', '')
-            
-            if record.get('spf_result') == 'fail' or record.get('dkim_result') == 'fail':
-                ip_failures[source_ip] += count
-                provider = self._identify_mail_provider(source_ip)
-                if provider:
-                    provider_failures[provider] += count
+        ip_failures = aggregates['ip_failures']
         
         return {
-            'top_failing_ips': dict(sorted(ip_failures.items(), key=lambda x: x[1], reverse=True)[:10]),
-            'provider_failures': dict(provider_failures),
+            'top_failing_ips': dict(ip_failures.most_common(10)),
+            'provider_failures': dict(aggregates['provider_failures']),
             'total_failing_ips': len(ip_failures)
         }
     
-    def _analyze_mail_providers(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _analyze_mail_providers(self, aggregates: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze which mail providers are being used"""
-        provider_stats = defaultdict(lambda: {'total': 0, 'pass': 0, 'fail': 0})
-        
-        for record in records:
-            count = record.get('count', 0)
-            source_ip = record.get('source_ip', '')
-            spf_result = record.get('spf_result')
-            dkim_result = record.get('dkim_result')
-            
-            provider = self._identify_mail_provider(source_ip) or 'unknown'
-            provider_stats[provider]['total'] += count
-            
-            if spf_result == 'pass' or dkim_result == 'pass':
-                provider_stats[provider]['pass'] += count
-            else:
-                provider_stats[provider]['fail'] += count
-        
-        return dict(provider_stats)
+        provider_pass = aggregates['provider_pass']
+        provider_fail = aggregates['provider_fail']
+        return {
+            provider: {'total': total, 'pass': provider_pass[provider], 'fail': provider_fail[provider]}
+            for provider, total in aggregates['provider_total'].items()
+        }
     
     def _detect_spf_issues(self, spf_analysis: SPFAnalysis, provider_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Detect SPF-related issues and generate recommendations"""
@@ -422,153 +614,52 @@ class DMARCAnalyzer:
         
         return issues
     
-    def _get_spf_record(self, domain: str) -> Optional[str]:
-        """Get SPF record for domain with caching"""
-        if domain in self.dns_cache:
-            return self.dns_cache[domain]
-        
-        try:
-            answers = dns.resolver.resolve(domain, 'TXT')
-            for rdata in answers:
-                txt_record = str(rdata).strip('"')
-                if txt_record.startswith('v=spf1'):
-                    self.dns_cache[domain] = txt_record
-                    return txt_record
-        except (dns.exception.DNSException, Exception) as e:
-            logger.debug(f"DNS lookup failed for {domain}: {e}")
-        
-        self.dns_cache[domain] = None
-        return None
-    
-    def _ip_authorized_by_spf(self, ip: str, spf_record: Optional[str]) -> bool:
-        """Check if IP is authorized by SPF record"""
-        if not spf_record:
-            return False
-        
-        try:
-            # Simple IP4/IP6 mechanism check
-            if f'ip4:{ip}' in spf_record or f'ip6:{ip}' in spf_record:
-                return True
-            
-            # Check for network ranges
-            for mechanism in re.findall(r'ip[46]:([^\s]+)', spf_record):
-                try:
-                    if '/' in mechanism:  # CIDR notation
-                        network = ipaddress.ip_network(mechanism, strict=False)
-                        if ipaddress.ip_address(ip) in network:
-                            return True
-                except ValueError:
-                    continue
-            
-            return False
-        except Exception:
-            return False
-    
-    def _identify_mail_provider(self, ip: str) -> Optional[str]:
-        """Identify mail service provider from IP address"""
-        if not ip:
-            return None
-        
-        try:
-            ip_addr = ipaddress.ip_address(ip)
-            
-            for provider, ranges in self.known_providers.items():
-                for ip_range in ranges:
-                    try:
-                        network = ipaddress.ip_network(ip_range, strict=False)
-                        if ip_addr in network:
-                            return provider
-                    except ValueError:
-                        continue
-        except ValueError:
-            pass
-        
-        return None
-    
-    def _calculate_health_score(self, failure_rate: float, issues: List[Dict[str, Any]], 
-                              spf_analysis: SPFAnalysis) -> int:
-        """Calculate overall domain health score (0-100)"""
-        base_score = 100
-        
-        # Penalize based on failure rate
-        base_score -= min(failure_rate * 2, 60)  # Up to 60 points for failures
-        
-        # Penalize based on issues
-        for issue in issues:
-            severity = issue.get('severity', 'low')
-            if severity == 'critical':
-                base_score -= 20
-            elif severity == 'high':
-                base_score -= 10
-            elif severity == 'medium':
-                base_score -= 5
-            else:
-                base_score -= 2
-        
-        # SPF record quality
-        if not spf_analysis.record:
-            base_score -= 25
-        elif spf_analysis.lookup_count > 10:
-            base_score -= 15
-        
-        return max(0, min(100, int(base_score)))
-    
-    def _determine_analysis_status(self, health_score: int, failure_rate: float) -> str:
-        """Determine overall analysis status"""
-        if health_score >= 90 and failure_rate < 5:
-            return 'excellent'
-        elif health_score >= 75 and failure_rate < 15:
-            return 'good'
-        elif health_score >= 50 and failure_rate < 30:
-            return 'warning'
-        else:
-            return 'critical'
-    
-    def _detect_alignment_issues(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _detect_alignment_issues(self, mismatches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Detect DMARC alignment issues"""
         issues = []
         
-        # Check for domain alignment issues
-        misaligned_domains = set()
-        for record in records:
-            header_from = record.get('header_from', '')
-            envelope_from = record.get('envelope_from', '')
-            spf_domain = record.get('spf_domain', '')
-            dkim_domain = record.get('dkim_domain', '')
-            
-            if header_from and envelope_from and header_from != envelope_from:
-                misaligned_domains.add(f"{header_from} (envelope: {envelope_from})")
-        
-        if misaligned_domains:
+        # Check for domain alignment issues; the RPC already returns only the top 5 pairs
+        if mismatches:
             issues.append({
                 'type': 'alignment_domain_mismatch',
                 'severity': 'medium',
                 'title': 'Domain Alignment Issues',
-                'message': f'Found domain misalignment in {len(misaligned_domains)} cases',
+                'message': f"Found domain misalignment in {mismatches[0]['total_mismatches']} cases",
                 'impact': 'May cause DMARC failures even with valid SPF/DKIM',
                 'category': 'alignment',
-                'details': list(misaligned_domains)[:5]  # Show first 5
+                'details': [f"{m['header_from']} (envelope: {m['envelope_from']})" for m in mismatches]
             })
         
         return issues
     
     def _get_spf_record(self, domain: str) -> Optional[str]:
         """Get SPF record for domain with caching"""
-        if domain in self.dns_cache:
-            return self.dns_cache[domain]
+        with _DNS_LOCK:
+            if domain in _DNS_CACHE:
+                return _DNS_CACHE[domain]
+            if domain in _DNS_ERROR_CACHE:
+                return None
         
+        spf_record = None
         try:
-            answers = dns.resolver.resolve(domain, 'TXT')
+            answers = _RESOLVER.resolve(domain, 'TXT')
             for rdata in answers:
                 txt_record = str(rdata).strip('"')
                 if txt_record.startswith('v=spf1'):
-                    self.dns_cache[domain] = txt_record
-                    return txt_record
-        except (dns.exception.DNSException, Exception) as e:
-            logger.debug(f"DNS lookup failed for {domain}: {e}")
+                    spf_record = txt_record
+                    break
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            # Authoritative answer: the domain has no TXT records
+            pass
+        except Exception as e:
+            logger.warning(f"DNS lookup failed for {domain}: {e}")
+            with _DNS_LOCK:
+                _DNS_ERROR_CACHE[domain] = None
+            return None
         
-        self.dns_cache[domain] = None
-        return None
+        with _DNS_LOCK:
+            _DNS_CACHE[domain] = spf_record
+        return spf_record
     
     def _ip_authorized_by_spf(self, ip: str, spf_record: Optional[str]) -> bool:
         """Check if IP is authorized by SPF record (simplified check)"""
@@ -576,44 +667,44 @@ class DMARCAnalyzer:
             return False
         
         try:
-            # Simple IP4/IP6 mechanism check
-            if f'ip4:{ip}' in spf_record or f'ip6:{ip}' in spf_record:
-                return True
-            
-            # Check for network ranges (simplified)
-            for mechanism in re.findall(r'ip[46]:([^\s]+)', spf_record):
-                try:
-                    if '/' in mechanism:  # CIDR notation
-                        network = ipaddress.ip_network(mechanism, strict=False)
-                        if ipaddress.ip_address(ip) in network:
-                            return True
-                except ValueError:
-                    continue
-            
-            return False
-        except Exception:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
             return False
+        
+        # CIDRs are parsed once per SPF record into sorted ranges of the same family, so each
+        # check is a binary search. Bare addresses parse as host networks, covering the
+        # exact-match case.
+        ip_int = int(address)
+        starts, ends = _parse_spf_networks(spf_record)[address.version]
+        idx = bisect.bisect_right(starts, ip_int) - 1
+        return idx >= 0 and ip_int <= ends[idx]
     
     def _identify_mail_provider(self, ip: str) -> Optional[str]:
         """Identify mail service provider from IP address"""
         if not ip:
             return None
         
+        if ip in self._provider_cache:
+            return self._provider_cache[ip]
+        
+        provider = None
         try:
             ip_addr = ipaddress.ip_address(ip)
+            ip_int = int(ip_addr)
+            starts, entries = self._provider_ranges[ip_addr.version]
             
-            for provider, ranges in self.known_providers.items():
-                for ip_range in ranges:
-                    try:
-                        network = ipaddress.ip_network(ip_range, strict=False)
-                        if ip_addr in network:
-                            return provider
-                    except ValueError:
-                        continue
+            # Provider ranges don't overlap, so the closest range starting at or
+            # below the address is the only candidate
+            idx = bisect.bisect_right(starts, ip_int) - 1
+            if idx >= 0:
+                _, end, name = entries[idx]
+                if ip_int <= end:
+                    provider = name
         except ValueError:
             pass
         
-        return None
+        self._provider_cache[ip] = provider
+        return provider
     
     def _calculate_health_score(self, failure_rate: float, issues: List[Dict[str, Any]], 
                               spf_analysis: SPFAnalysis, dkim_analysis: DKIMAnalysis) -> int:
@@ -2,12 +2,16 @@ from fastapi import HTTPException, Depends, Security, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import Client
 import jwt
-from jwt import PyJWTError
+from jwt import PyJWTError, PyJWKClient
 import os
+import time
+import hashlib
+import threading
+from cachetools import TTLCache
 from typing import Optional, Dict, Any
 import logging
 
-from config import get_supabase_client
+from config import get_supabase_client, invalidate_supabase_client, SUPABASE_URL
 
 logger = logging.getLogger(__name__)
 
@@ -16,13 +20,55 @@ security = HTTPBearer()
 # Supabase JWT secret
 SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET')
 
+# Tokens signed with Supabase's asymmetric signing keys are verified locally against the
+# project's JWKS (fetched once and cached by PyJWKClient) using cryptography's OpenSSL backend
+ASYMMETRIC_ALGORITHMS = ('RS256', 'ES256')
+_jwks_client = PyJWKClient(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", cache_jwk_set=True, lifespan=3600)
+
+# Verified token claims, keyed by token digest, so repeat requests with the same token skip
+# signature checks and the Supabase API round-trip. Entries never outlive the token's exp.
+VERIFIED_TOKEN_TTL = 300
+_verified_tokens = TTLCache(maxsize=4096, ttl=VERIFIED_TOKEN_TTL)
+
+# Users whose profile row is known to exist, so the upsert runs once per user rather than per request
+_known_profiles = TTLCache(maxsize=10_000, ttl=3600)
+_auth_cache_lock = threading.Lock()
+
 class AuthManager:
     def __init__(self):
         self.supabase = get_supabase_client()
     
     def verify_jwt_token(self, token: str) -> Dict[str, Any]:
         """Verify Supabase JWT token and return user data"""
+        token_key = hashlib.sha256(token.encode()).digest()
+        with _auth_cache_lock:
+            cached = _verified_tokens.get(token_key)
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+        
+        payload = self._verify_jwt_token(token)
+        
+        # Cache until the token expires, capped at VERIFIED_TOKEN_TTL
+        expires_at = min(payload.get('exp') or float('inf'), time.time() + VERIFIED_TOKEN_TTL)
+        with _auth_cache_lock:
+            _verified_tokens[token_key] = (payload, expires_at)
+        
+        return payload
+    
+    def _verify_jwt_token(self, token: str) -> Dict[str, Any]:
+        """Verify a token's signature and claims without consulting the cache"""
         try:
+            algorithm = jwt.get_unverified_header(token).get('alg')
+            if algorithm in ASYMMETRIC_ALGORITHMS:
+                # Verify locally against the cached JWKS
+                signing_key = _jwks_client.get_signing_key_from_jwt(token)
+                return jwt.decode(
+                    token,
+                    signing_key.key,
+                    algorithms=[algorithm],
+                    audience="authenticated"
+                )
+            
             if not SUPABASE_JWT_SECRET:
                 # Fallback: verify with Supabase API
                 return self._verify_with_supabase_api(token)
@@ -43,6 +89,8 @@ class AuthManager:
                 status_code=401,
                 detail="Invalid authentication token"
             )
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Token verification error: {e}")
             raise HTTPException(
@@ -102,17 +150,30 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Security(securi
         
         return user
         
-    except HTTPException:
+    except HTTPException as e:
+        if e.status_code == 401:
+            # A rejected token must not keep a cached client alive
+            invalidate_supabase_client(credentials.credentials)
         raise
     except Exception as e:
         logger.error(f"Authentication error: {e}")
+        invalidate_supabase_client(credentials.credentials)
         raise HTTPException(
             status_code=401,
             detail="Authentication failed"
         )
 
+def get_user_supabase_client(user: Dict[str, Any] = Depends(get_current_user)) -> Client:
+    """FastAPI dependency for a Supabase client acting as the current user (for RLS)"""
+    # Clients are cached per access token and share one pooled HTTP/2 connection pool
+    return get_supabase_client(user.get('access_token'))
+
 def _ensure_user_profile(user: Dict[str, Any]) -> None:
     """Ensure user profile exists in the profiles table"""
+    with _auth_cache_lock:
+        if _known_profiles.get(user['id']) == user['email']:
+            return
+    
     try:
         supabase = get_supabase_client()
         
@@ -123,6 +184,8 @@ def _ensure_user_profile(user: Dict[str, Any]) -> None:
         
         # Use upsert to handle existing profiles gracefully
         supabase.table('profiles').upsert(profile_data, on_conflict='id').execute()
+        with _auth_cache_lock:
+            _known_profiles[user['id']] = user['email']
         
     except Exception as e:
         logger.warning(f"Failed to ensure user profile: {e}")
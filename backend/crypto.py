@@ -8,6 +8,7 @@ import os
 import json
 import base64
 import secrets
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, Tuple
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -27,6 +28,13 @@ class CredentialEncryption:
         self.current_key_file = os.path.join(key_storage_path, "current_key.json")
         self.backup_keys_dir = os.path.join(key_storage_path, "backup_keys")
         
+        # Parsed key file and per-key AESGCM instances, so hot paths skip disk reads,
+        # JSON parsing and AES key expansion. The key file is re-read when its mtime changes.
+        self._current_key_info = None
+        self._current_key_mtime = None
+        self._ciphers: Dict[str, AESGCM] = {}
+        self._lock = threading.Lock()
+        
         # Ensure directories exist
         os.makedirs(key_storage_path, exist_ok=True)
         os.makedirs(self.backup_keys_dir, exist_ok=True)
@@ -43,8 +51,14 @@ class CredentialEncryption:
         """Get current encryption key info, create if doesn't exist"""
         try:
             if os.path.exists(self.current_key_file):
-                with open(self.current_key_file, 'r') as f:
-                    key_info = json.load(f)
+                mtime = os.stat(self.current_key_file).st_mtime_ns
+                if self._current_key_info is not None and mtime == self._current_key_mtime:
+                    key_info = self._current_key_info
+                else:
+                    with open(self.current_key_file, 'r') as f:
+                        key_info = json.load(f)
+                    self._current_key_info = key_info
+                    self._current_key_mtime = mtime
                 
                 # Check if key needs rotation (monthly)
                 created_date = datetime.fromisoformat(key_info['created_at'])
@@ -111,6 +125,18 @@ class CredentialEncryption:
             # If rotation fails, continue with old key
             return old_key_info
     
+    def _get_cipher(self, key_id: str) -> Optional[AESGCM]:
+        """Get a cached AESGCM instance for a key ID"""
+        cipher = self._ciphers.get(key_id)
+        if cipher is None:
+            key = self._get_key_by_id(key_id)
+            if not key:
+                return None
+            cipher = AESGCM(key)
+            with self._lock:
+                self._ciphers[key_id] = cipher
+        return cipher
+    
     def _get_key_by_id(self, key_id: str) -> Optional[bytes]:
         """Get encryption key by ID (for decryption of old data)"""
         try:
@@ -141,13 +167,12 @@ class CredentialEncryption:
         """
         try:
             key_info = self._get_current_key_info()
-            key = base64.b64decode(key_info['key'])
+            aesgcm = self._get_cipher(key_info['key_id'])
             
             # Generate random nonce
             nonce = os.urandom(12)  # 96-bit nonce for GCM
             
             # Encrypt the credential
-            aesgcm = AESGCM(key)
             ciphertext = aesgcm.encrypt(nonce, credential.encode('utf-8'), None)
             
             # Combine nonce + ciphertext
@@ -169,8 +194,8 @@ class CredentialEncryption:
         Returns: decrypted credential string
         """
         try:
-            key = self._get_key_by_id(key_id)
-            if not key:
+            aesgcm = self._get_cipher(key_id)
+            if not aesgcm:
                 raise Exception(f"Encryption key not found for ID: {key_id}")
             
             # Decode base64
@@ -181,7 +206,6 @@ class CredentialEncryption:
             ciphertext = encrypted_data[12:]  # Rest is ciphertext
             
             # Decrypt
-            aesgcm = AESGCM(key)
             plaintext = aesgcm.decrypt(nonce, ciphertext, None)
             
             return plaintext.decode('utf-8')
@@ -242,6 +266,30 @@ class CredentialEncryption:
             results['error_count'] += len(user_credentials)
             return results
 
+# Error reported for configs whose password is still legacy base64 (see migrate_legacy_passwords.py)
+LEGACY_CREDENTIAL_ERROR = "Stored IMAP password uses the retired base64 format; re-enter the password to update it"
+
+def upgrade_legacy_credential(supabase, config: Dict[str, Any], password: str) -> bool:
+    """
+    Re-encrypt an IMAP config whose password is still stored as legacy base64
+    Called after a successful legacy decode so the plaintext-equivalent copy is replaced
+    with AES-256-GCM; failures are logged and leave the legacy value in place
+    """
+    try:
+        password_encrypted, encryption_key_id = get_credential_encryption().encrypt_credential(password)
+        supabase.table('imap_configs').update({
+            'password_encrypted': password_encrypted,
+            'encryption_key_id': encryption_key_id
+        }).eq('id', config['id']).execute()
+        
+        config['password_encrypted'] = password_encrypted
+        config['encryption_key_id'] = encryption_key_id
+        logger.info(f"Upgraded legacy base64 credential to AES-256-GCM for config {config['id']}")
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to upgrade legacy credential for config {config['id']}: {e}")
+        return False
+
 # Global encryption instance
 _encryption_instance = None
 
@@ -25,6 +25,9 @@ class DMARCFailureAnalyzer:
             '2607:f8b0::/32',
             '2a00:1450::/32'
         ]
+        
+        # Parse the ranges once so lookups are plain membership checks
+        self._google_networks = [ipaddress.ip_network(ip_range, strict=False) for ip_range in self.google_ranges]
     
     def analyze_report_data(self, domain: str, report_data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -109,8 +112,7 @@ class DMARCFailureAnalyzer:
         
         try:
             ip_addr = ipaddress.ip_address(ip)
-            for ip_range in self.google_ranges:
-                network = ipaddress.ip_network(ip_range, strict=False)
+            for network in self._google_networks:
                 if ip_addr in network:
                     return True
         except ValueError:
@@ -6,8 +6,10 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 import imapclient
 import re
+from postgrest.types import ReturnMethod
 from config import get_supabase_client, IMAP_CONFIG
 from dmarc_parser import extract_attachment, parse_dmarc_xml
+from rate_limiter import get_imap_rate_limiter
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -45,6 +47,9 @@ DMARC_ATTACHMENT_PATTERNS = [
     r'.*\.zip$',  # Any zip file (will be validated by content)
 ]
 
+# Rows per dmarc_records bulk insert; keeps each PostgREST request body well under its size limits
+RECORD_INSERT_BATCH_SIZE = 500
+
 def is_dmarc_email(email_message) -> bool:
     """Enhanced DMARC email detection"""
     try:
@@ -117,7 +122,6 @@ def connect_imap(host: str, username: str, password: str, port: int = 993, use_s
         # Record the attempt in rate limiter if user_id provided
         if user_id:
             try:
-                from rate_limiter import get_imap_rate_limiter
                 rate_limiter = get_imap_rate_limiter()
                 rate_limiter.record_attempt(user_id, success, config_name or f"{username}@{host}")
             except Exception as rate_e:
@@ -263,10 +267,9 @@ def store_dmarc_report(supabase, user_id: str, imap_config_id: str, report_data:
         
         # Only insert records if this is a new report to avoid duplicate records
         if is_new_report:
-            # Store individual records in batches for better performance
-            records_to_insert = []
-            for record in report_data['records']:
-                record_data = {
+            # Store individual records with bulk inserts: one round-trip per batch, never per row
+            records_to_insert = [
+                {
                     'report_id': db_report_id,
                     'source_ip': record['source_ip'],
                     'count': record['count'],
@@ -280,14 +283,14 @@ def store_dmarc_report(supabase, user_id: str, imap_config_id: str, report_data:
                     'envelope_from': record.get('envelope_from'),
                     'envelope_to': record.get('envelope_to')
                 }
-                records_to_insert.append(record_data)
+                for record in report_data['records']
+            ]
             
-            # Batch insert records (Supabase handles up to 1000 records per batch)
             if records_to_insert:
-                batch_size = 1000
-                for i in range(0, len(records_to_insert), batch_size):
-                    batch = records_to_insert[i:i + batch_size]
-                    supabase.table('dmarc_records').insert(batch).execute()
+                for i in range(0, len(records_to_insert), RECORD_INSERT_BATCH_SIZE):
+                    batch = records_to_insert[i:i + RECORD_INSERT_BATCH_SIZE]
+                    # returning=minimal: the inserted rows aren't needed, so don't ship them back
+                    supabase.table('dmarc_records').insert(batch, returning=ReturnMethod.minimal).execute()
                 
                 logger.info(f"Stored {len(report_data['records'])} records for report {db_report_id}")
         else:
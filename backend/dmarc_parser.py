@@ -30,6 +30,10 @@ def extract_attachment(payload: bytes, filename: str = None) -> bytes:
         logger.error(f"Failed to extract attachment: {e}")
         return payload
 
+def parse_dmarc_payload(payload: bytes) -> Dict[str, Any]:
+    """Parse a raw DMARC report that may be zip/gzip compressed"""
+    return parse_dmarc_xml(extract_attachment(payload))
+
 def parse_dmarc_xml(xml_data: bytes) -> Dict[str, Any]:
     """Parse DMARC XML report into structured data"""
     try:
@@ -0,0 +1,105 @@
+"""
+Background job tracking for user-triggered processing
+Jobs are rows in the processing_jobs table, so clients can poll a job after a 202 response
+no matter which API worker accepted it or runs it
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
+import logging
+
+from config import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+JOB_COLUMNS = 'id,user_id,kind,status,result,error,created_at,started_at,heartbeat_at,finished_at'
+
+# Seconds between heartbeats written by a running job
+JOB_HEARTBEAT_INTERVAL = 60
+
+# A queued/running job not heard from for this long was lost with the worker that ran it
+# (restart, crash); it no longer blocks new jobs of the same kind
+STALE_JOB_AFTER = timedelta(minutes=5)
+
+def create_job(supabase, kind: str, user_id: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Queue a job for a user
+    Returns (job, created); an already queued/running job of the same kind is returned instead
+    """
+    active = _get_active_job(supabase, kind, user_id)
+    if active:
+        if not _is_stale(active):
+            return _public_job(active), False
+        logger.warning(f"Job {active['id']} is {active['status']} but has not been heard from, marking it failed")
+        fail_job(active['id'], user_id, "Job was interrupted before it finished")
+
+    try:
+        result = supabase.table('processing_jobs').insert({
+            'user_id': user_id,
+            'kind': kind,
+            'status': QUEUED
+        }).execute()
+        return _public_job(result.data[0]), True
+    except Exception as e:
+        # The unique index on active jobs means another worker queued one since our lookup
+        if '23505' in str(e) or 'duplicate key' in str(e).lower():
+            active = _get_active_job(supabase, kind, user_id)
+            if active:
+                return _public_job(active), False
+        raise
+
+def get_job(supabase, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """Get a job, only if it belongs to the user"""
+    result = supabase.table('processing_jobs').select(JOB_COLUMNS).eq('id', job_id).eq('user_id', user_id).limit(1).execute()
+    return _public_job(result.data[0]) if result.data else None
+
+# Status writes use the service role: a long job can outlive the triggering user's access
+# token, and must still be able to record how it ended. The user_id filter keeps each write
+# scoped to the job's owner.
+
+def mark_job_running(job_id: str, user_id: str) -> None:
+    now = _now()
+    _update_job(job_id, user_id, status=RUNNING, started_at=now, heartbeat_at=now)
+
+def heartbeat_job(job_id: str, user_id: str) -> None:
+    """Record that a running job is still alive"""
+    _update_job(job_id, user_id, heartbeat_at=_now())
+
+def complete_job(job_id: str, user_id: str, result: Dict[str, Any]) -> None:
+    _update_job(job_id, user_id, status=COMPLETED, result=result, finished_at=_now())
+
+def fail_job(job_id: str, user_id: str, error: str) -> None:
+    _update_job(job_id, user_id, status=FAILED, error=error, finished_at=_now())
+
+def _get_active_job(supabase, kind: str, user_id: str) -> Optional[Dict[str, Any]]:
+    result = supabase.table('processing_jobs').select(JOB_COLUMNS).eq('user_id', user_id).eq('kind', kind).in_(
+        'status', [QUEUED, RUNNING]
+    ).limit(1).execute()
+    return result.data[0] if result.data else None
+
+def _is_stale(job: Dict[str, Any]) -> bool:
+    last_seen = job.get('heartbeat_at') or job.get('started_at') or job['created_at']
+    return datetime.now(timezone.utc) - datetime.fromisoformat(last_seen) > STALE_JOB_AFTER
+
+def _update_job(job_id: str, user_id: str, **fields) -> None:
+    try:
+        supabase = get_supabase_client(use_service_role=True)
+        supabase.table('processing_jobs').update(fields).eq('id', job_id).eq('user_id', user_id).execute()
+    except Exception as e:
+        logger.error(f"Error updating job {job_id}: {str(e)}")
+
+def _public_job(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A job row as returned to clients"""
+    job = dict(row)
+    job['job_id'] = job.pop('id')
+    job.pop('user_id', None)
+    return job
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
@@ -1,7 +1,7 @@
 import uvicorn
 import os
 from api import app
-from scheduler import start_background_scheduler
+from rate_limiter import check_rate_limit_backend
 import logging
 
 # Setup logging
@@ -9,12 +9,21 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    # Start the background scheduler for automated daily processing
-    logger.info("Starting DMARC automated scheduler")
-    start_background_scheduler()
-    
     # Get port from environment or default to 8000 (matching Docker configuration)
     port = int(os.getenv("PORT", 8000))
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    check_rate_limit_backend(workers)
     
-    # Start the FastAPI application
-    uvicorn.run(app, host="0.0.0.0", port=port) 
\ No newline at end of file
+    # Start the FastAPI application. The background scheduler is started by the app's startup
+    # hook in exactly one worker. Multiple workers need the app as an import string; in-memory
+    # caches are per worker, so scale out with WEB_CONCURRENCY deliberately; IMAP rate limits
+    # must then be shared through RATE_LIMIT_BACKEND=database.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=30  # outlive typical load balancer idle timeouts instead of churning connections
+    )
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+One-time migration: re-encrypt IMAP passwords still stored as legacy base64 with AES-256-GCM
+Run once per environment (with SUPABASE_SERVICE_ROLE_KEY set) before deploying code that no
+longer decodes legacy passwords.
+"""
+
+import sys
+import os
+import base64
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import get_supabase_client, SUPABASE_SERVICE_ROLE_KEY
+from crypto import upgrade_legacy_credential
+
+def migrate_legacy_passwords() -> bool:
+    """Re-encrypt every legacy base64 IMAP password; returns True if none are left"""
+    if not SUPABASE_SERVICE_ROLE_KEY:
+        print("❌ SUPABASE_SERVICE_ROLE_KEY is required to update every user's configs")
+        return False
+
+    supabase = get_supabase_client(use_service_role=True)
+
+    # Legacy rows have a password but no encryption key id
+    result = supabase.table('imap_configs').select('id,name,password_encrypted').is_(
+        'encryption_key_id', 'null'
+    ).not_.is_('password_encrypted', 'null').execute()
+    configs = result.data or []
+
+    if not configs:
+        print("✅ No legacy base64 passwords found")
+        return True
+
+    print(f"Found {len(configs)} legacy base64 password(s)")
+    failed = 0
+    for config in configs:
+        try:
+            password = base64.b64decode(config['password_encrypted']).decode()
+        except Exception as e:
+            print(f"   ❌ Config '{config['name']}' ({config['id']}): could not decode: {str(e)}")
+            failed += 1
+            continue
+
+        if upgrade_legacy_credential(supabase, config, password):
+            print(f"   ✅ Config '{config['name']}' ({config['id']}) re-encrypted")
+        else:
+            print(f"   ❌ Config '{config['name']}' ({config['id']}): update failed, see log")
+            failed += 1
+
+    print(f"Migrated {len(configs) - failed} of {len(configs)} config(s)")
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if migrate_legacy_passwords() else 1)
@@ -2,17 +2,25 @@
 Rate limiting module for IMAP connection attempts
 Uses in-memory counters with exponential backoff
 Lean startup approach: no Redis infrastructure needed
+In-memory counters are per process; set RATE_LIMIT_BACKEND=database to share them in Postgres
+when running more than one API worker
 """
 
+import os
 import time
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, Tuple
 from collections import defaultdict
 import logging
 
+from config import get_supabase_client, SUPABASE_SERVICE_ROLE_KEY
+
 logger = logging.getLogger(__name__)
 
+# 'memory' (default, per process) or 'database' (shared by every worker and the scheduler)
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+
 class IMAPRateLimiter:
     """
     In-memory rate limiter for IMAP connections
@@ -251,6 +259,158 @@ class IMAPRateLimiter:
             
             return had_limits
 
+class DatabaseRateLimiter(IMAPRateLimiter):
+    """
+    Rate limiter backed by Postgres, shared by every API worker and the scheduler
+    Same limits and backoff as the in-memory limiter; counters and blocks live in the
+    imap_connection_attempts and imap_rate_limit_state tables, updated through RPCs
+    """
+    
+    def _client(self):
+        return get_supabase_client(use_service_role=True)
+    
+    def is_rate_limited(self, user_id: str) -> Tuple[bool, Optional[str], Optional[int]]:
+        """
+        Check if user is rate limited
+        Returns: (is_limited, reason, retry_after_seconds)
+        """
+        try:
+            result = self._client().rpc('imap_rate_limit_check', {
+                'p_user_id': user_id,
+                'p_max_per_minute': self.max_attempts_per_minute,
+                'p_max_per_hour': self.max_attempts_per_hour
+            }).execute()
+        except Exception as e:
+            # Don't lock every user out of IMAP while the limiter store is unreachable
+            logger.error(f"Rate limit check failed for user {user_id}: {str(e)}")
+            return False, None, None
+        
+        row = result.data[0]
+        return row['is_limited'], row['reason'], row['retry_after']
+    
+    def record_attempt(self, user_id: str, success: bool, config_name: str = "unknown") -> None:
+        """
+        Record a connection attempt
+        Args:
+            user_id: User making the attempt
+            success: Whether the connection was successful
+            config_name: Name of the IMAP config for logging
+        """
+        try:
+            result = self._client().rpc('imap_rate_limit_record', {
+                'p_user_id': user_id,
+                'p_success': success,
+                'p_max_failed': self.max_failed_attempts,
+                'p_backoff_base': self.backoff_base,
+                'p_backoff_max': self.backoff_max
+            }).execute()
+        except Exception as e:
+            logger.error(f"Error recording IMAP connection attempt for user {user_id}: {str(e)}")
+            return
+        
+        row = result.data[0]
+        failed_count = row['failed_attempts']
+        
+        if success:
+            if failed_count > 0:
+                logger.info(f"User {user_id} successful connection to {config_name} - failed attempts reset")
+            return
+        
+        logger.warning(f"Failed IMAP connection for user {user_id} to {config_name} (attempt {failed_count})")
+        if row['blocked_seconds']:
+            logger.warning(
+                f"User {user_id} blocked for {row['blocked_seconds']} seconds due to {failed_count} failed attempts"
+            )
+    
+    def get_user_stats(self, user_id: str) -> Dict[str, Any]:
+        """Get rate limiting stats for a user"""
+        supabase = self._client()
+        now = datetime.now(timezone.utc)
+        
+        attempts = supabase.table('imap_connection_attempts').select('attempted_at').eq('user_id', user_id).gt(
+            'attempted_at', (now - timedelta(hours=1)).isoformat()
+        ).execute().data
+        state = supabase.table('imap_rate_limit_state').select('failed_attempts,blocked_until').eq(
+            'user_id', user_id
+        ).limit(1).execute().data
+        
+        minute_ago = now - timedelta(minutes=1)
+        attempts_last_minute = len([a for a in attempts if datetime.fromisoformat(a['attempted_at']) > minute_ago])
+        attempts_last_hour = len(attempts)
+        
+        failed_count = state[0]['failed_attempts'] if state else 0
+        blocked_until = state[0]['blocked_until'] if state else None
+        time_until_unblocked = 0
+        if blocked_until:
+            time_until_unblocked = max(0, int((datetime.fromisoformat(blocked_until) - now).total_seconds()))
+        is_blocked = time_until_unblocked > 0
+        
+        return {
+            "attempts_last_minute": attempts_last_minute,
+            "attempts_last_hour": attempts_last_hour,
+            "max_attempts_per_minute": self.max_attempts_per_minute,
+            "max_attempts_per_hour": self.max_attempts_per_hour,
+            "failed_attempts": failed_count,
+            "max_failed_attempts": self.max_failed_attempts,
+            "is_blocked": is_blocked,
+            "time_until_unblocked": time_until_unblocked,
+            "remaining_attempts_minute": max(0, self.max_attempts_per_minute - attempts_last_minute),
+            "remaining_attempts_hour": max(0, self.max_attempts_per_hour - attempts_last_hour)
+        }
+    
+    def get_global_stats(self) -> Dict[str, Any]:
+        """Get global rate limiting statistics"""
+        supabase = self._client()
+        now = datetime.now(timezone.utc)
+        
+        attempts = supabase.table('imap_connection_attempts').select('user_id').gt(
+            'attempted_at', (now - timedelta(hours=1)).isoformat()
+        ).execute().data
+        states = supabase.table('imap_rate_limit_state').select('blocked_until').execute().data
+        
+        return {
+            "total_active_users": len({a['user_id'] for a in attempts}),
+            "blocked_users": len([
+                s for s in states if s['blocked_until'] and datetime.fromisoformat(s['blocked_until']) > now
+            ]),
+            "users_with_failures": len(states),
+            "total_attempts_last_hour": len(attempts),
+            # Old attempts are pruned on every write rather than by a periodic sweep
+            "cleanup_last_run": None
+        }
+    
+    def reset_user_limits(self, user_id: str) -> bool:
+        """
+        Reset rate limits for a specific user (admin function)
+        Returns: True if user had limits to reset
+        """
+        supabase = self._client()
+        attempts = supabase.table('imap_connection_attempts').delete().eq('user_id', user_id).execute()
+        state = supabase.table('imap_rate_limit_state').delete().eq('user_id', user_id).execute()
+        
+        had_limits = bool(attempts.data or state.data)
+        if had_limits:
+            logger.info(f"Rate limits reset for user {user_id}")
+        
+        return had_limits
+
+def check_rate_limit_backend(workers: int) -> None:
+    """
+    Refuse to run a configuration where the limits would not hold
+    In-memory counters are per process, so each of several workers would allow the full limits
+    """
+    if RATE_LIMIT_BACKEND not in ('memory', 'database'):
+        raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND '{RATE_LIMIT_BACKEND}', expected 'memory' or 'database'")
+    
+    if RATE_LIMIT_BACKEND == 'database' and not SUPABASE_SERVICE_ROLE_KEY:
+        raise RuntimeError("RATE_LIMIT_BACKEND=database requires SUPABASE_SERVICE_ROLE_KEY")
+    
+    if RATE_LIMIT_BACKEND == 'memory' and workers > 1:
+        raise RuntimeError(
+            f"WEB_CONCURRENCY={workers} with in-memory IMAP rate limits would give each worker its own "
+            "limits; set RATE_LIMIT_BACKEND=database to share them, or run a single worker"
+        )
+
 # Global rate limiter instance
 _rate_limiter_instance = None
 
@@ -258,5 +418,8 @@ def get_imap_rate_limiter() -> IMAPRateLimiter:
     """Get singleton rate limiter instance"""
     global _rate_limiter_instance
     if _rate_limiter_instance is None:
-        _rate_limiter_instance = IMAPRateLimiter()
+        if RATE_LIMIT_BACKEND == 'database':
+            _rate_limiter_instance = DatabaseRateLimiter()
+        else:
+            _rate_limiter_instance = IMAPRateLimiter()
     return _rate_limiter_instance 
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Response caching module for read-heavy dashboard endpoints
+Uses in-memory TTL caches keyed by user, invalidated when the user's reports change
+Lean startup approach: no Redis infrastructure needed
+"""
+
+import os
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Optional, Tuple
+import logging
+
+import orjson
+from cachetools import TTLCache
+from fastapi import Request, Response
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached response may be served from this process. Invalidation only reaches the
+# worker that ingested the reports, so this also bounds how stale other uvicorn workers can be.
+# Browsers are not given a max-age: they always revalidate against the ETag (see cache_control).
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '30'))
+
+# A cached entry: (payload, etag, payload serialized as JSON)
+CachedResponse = Tuple[Dict[str, Any], str, bytes]
+
+# Cache namespaces, one per cached endpoint
+ANALYTICS_SUMMARY = 'analytics_summary'
+REPORTS_LIST = 'reports_list'
+IMAP_CONFIGS = 'imap_configs'
+
+class ResponseCache:
+    """
+    In-memory per-user response cache
+    Entries expire after a short TTL and are dropped as soon as new reports are ingested
+    """
+
+    def __init__(self, ttl: int = RESPONSE_CACHE_TTL, maxsize: int = 10_000):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)  # {(namespace, user_id): CachedResponse}
+        self.namespaces = set()
+        self.inflight = {}  # {(namespace, user_id): Future} for misses being computed
+        self.lock = threading.Lock()
+
+        # Browsers must revalidate every time (a cheap 304 via the ETag), so a user sees their
+        # own uploads and config changes as soon as the server-side entry is invalidated
+        self.cache_control = 'private, no-cache'
+
+    def get(self, namespace: str, user_id: str) -> Optional[CachedResponse]:
+        """Return the cached (payload, etag, body) for a user, if any"""
+        with self.lock:
+            return self.entries.get((namespace, user_id))
+
+    def set(self, namespace: str, user_id: str, payload: Dict[str, Any]) -> CachedResponse:
+        """Cache a response payload for a user and return the cached entry"""
+        # Serialized once here: the bytes give the ETag and are served as-is on every hit
+        body = orjson.dumps(payload)
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = (payload, etag, body)
+        with self.lock:
+            self.entries[(namespace, user_id)] = entry
+            self.namespaces.add(namespace)
+        return entry
+
+    def get_or_compute(self, namespace: str, user_id: str, compute: Callable[[], Dict[str, Any]]) -> CachedResponse:
+        """
+        Return the cached entry for a user, computing and caching it on a miss
+        Concurrent misses for the same entry share a single compute() call
+        """
+        key = (namespace, user_id)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached:
+                return cached
+            inflight = self.inflight.get(key)
+            is_leader = inflight is None
+            if is_leader:
+                inflight = self.inflight[key] = Future()
+
+        if not is_leader:
+            # Another request is already fetching this entry; wait for its result (or error)
+            return inflight.result()
+
+        try:
+            result = self.set(namespace, user_id, compute())
+            inflight.set_result(result)
+            return result
+        except Exception as e:
+            inflight.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached response for a user (call after their reports or configs change)"""
+        with self.lock:
+            for namespace in self.namespaces:
+                self.entries.pop((namespace, user_id), None)
+        logger.debug(f"Response cache invalidated for user {user_id}")
+
+    def respond(self, request: Request, cached: CachedResponse) -> Response:
+        """
+        Build the response for a cached entry: its pre-serialized body, or an empty 304 if the
+        client already has it. Returning a Response skips FastAPI's jsonable_encoder pass.
+        """
+        _, etag, body = cached
+        headers = {'ETag': etag, 'Cache-Control': self.cache_control}
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=body, media_type='application/json', headers=headers)
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag (RFC 9110)"""
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+# Global response cache instance
+_response_cache_instance = None
+
+def get_response_cache() -> ResponseCache:
+    """Get singleton response cache instance"""
+    global _response_cache_instance
+    if _response_cache_instance is None:
+        _response_cache_instance = ResponseCache()
+    return _response_cache_instance
@@ -4,17 +4,29 @@ import schedule
 import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
-import base64
 import threading
 import os
 
+try:
+    import fcntl
+except ImportError:  # Non-POSIX platforms: single-process deployments only
+    fcntl = None
+
 from config import get_supabase_client
 from dmarc_ingest import process_dmarc_ingestion
+from crypto import get_credential_encryption, LEGACY_CREDENTIAL_ERROR
+from rate_limiter import get_imap_rate_limiter
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Lock file shared by all uvicorn workers on the host; only the holder runs the scheduler
+SCHEDULER_LOCK_PATH = os.getenv('DMARC_SCHEDULER_LOCK_PATH', '/tmp/dmarc-scheduler.lock')
+
+# Held by whichever worker is running a processing run, scheduled or manual
+PROCESSING_LOCK_PATH = os.getenv('DMARC_PROCESSING_LOCK_PATH', '/tmp/dmarc-processing.lock')
+
 class DmarcScheduler:
     """Automated DMARC email processing scheduler"""
     
@@ -22,6 +34,15 @@ class DmarcScheduler:
         self.is_running = False
         self.scheduler_thread = None
         
+        # Held for the duration of a processing run so scheduled and manual runs never overlap
+        self.processing_lock = threading.Lock()
+        
+        # Open handle on SCHEDULER_LOCK_PATH while this process is the scheduler leader
+        self.leader_lock_file = None
+        
+        # Open handle on PROCESSING_LOCK_PATH while this process runs a processing run
+        self.processing_lock_file = None
+    
     def get_active_imap_configs(self) -> List[Dict[str, Any]]:
         """Get all active IMAP configurations for all users"""
         try:
@@ -30,7 +51,7 @@ class DmarcScheduler:
             
             # Get all active IMAP configs with user profiles
             result = supabase.table('imap_configs').select(
-                'id, user_id, name, host, port, username, password_encrypted, use_ssl, folder, last_polled_at, profiles(email)'
+                'id, user_id, name, host, port, username, password_encrypted, encryption_key_id, use_ssl, folder, last_polled_at, profiles(email)'
             ).eq('is_active', True).execute()
             
             logger.info(f"Found {len(result.data)} active IMAP configurations")
@@ -51,7 +72,6 @@ class DmarcScheduler:
         
         try:
             # Check rate limits before processing (background tasks get relaxed limits)
-            from rate_limiter import get_imap_rate_limiter
             rate_limiter = get_imap_rate_limiter()
             
             is_limited, reason, retry_after = rate_limiter.is_rate_limited(user_id)
@@ -71,7 +91,6 @@ class DmarcScheduler:
             # Decrypt password
             if config.get('password_encrypted') and config.get('encryption_key_id'):
                 try:
-                    from crypto import get_credential_encryption
                     encryption = get_credential_encryption()
                     config['password'] = encryption.decrypt_credential(
                         config['password_encrypted'], 
@@ -81,13 +100,9 @@ class DmarcScheduler:
                     logger.error(f"Failed to decrypt password for config {config_id}: {e}")
                     return {"status": "error", "error": "Failed to decrypt password"}
             elif config.get('password_encrypted'):
-                # Legacy base64 decryption for backward compatibility
-                try:
-                    config['password'] = base64.b64decode(config['password_encrypted']).decode()
-                    logger.warning(f"Using legacy base64 decryption for scheduled config {config_id}")
-                except Exception as e:
-                    logger.error(f"Failed to decrypt legacy password for config {config_id}: {e}")
-                    return {"status": "error", "error": "Failed to decrypt password"}
+                # Legacy base64 passwords are re-encrypted once by migrate_legacy_passwords.py
+                logger.error(f"Config {config_id} still has a legacy base64 password")
+                return {"status": "error", "error": LEGACY_CREDENTIAL_ERROR}
             else:
                 logger.error(f"No password configured for config {config_id}")
                 return {"status": "error", "error": "No password configured"}
@@ -114,8 +129,46 @@ class DmarcScheduler:
                 "error": str(e)
             }
     
+    def try_start_processing(self) -> bool:
+        """
+        Claim the processing run for this process, across all workers on the host
+        Returns False if a run is already in progress; otherwise the caller must run
+        run_claimed_processing (or finish_processing)
+        """
+        if not self.processing_lock.acquire(blocking=False):
+            return False
+        
+        lock_file = _try_flock(PROCESSING_LOCK_PATH)
+        if lock_file is False:
+            self.processing_lock.release()
+            return False
+        
+        self.processing_lock_file = lock_file
+        return True
+    
+    def finish_processing(self):
+        """Release a run claimed with try_start_processing"""
+        if self.processing_lock_file:
+            self.processing_lock_file.close()
+            self.processing_lock_file = None
+        self.processing_lock.release()
+    
+    def run_claimed_processing(self):
+        """Run processing claimed with try_start_processing, releasing the claim when done"""
+        try:
+            self._run_daily_processing()
+        finally:
+            self.finish_processing()
+    
     def run_daily_processing(self):
         """Run daily DMARC email processing for all active configurations"""
+        if not self.try_start_processing():
+            logger.warning("Daily processing is already running, skipping this trigger")
+            return
+        
+        self.run_claimed_processing()
+    
+    def _run_daily_processing(self):
         logger.info("Starting daily DMARC email processing")
         start_time = datetime.now()
         
@@ -160,12 +213,31 @@ class DmarcScheduler:
         except Exception as e:
             logger.error(f"Error in daily processing: {e}")
     
+    def _acquire_leader_lock(self) -> bool:
+        """Take the host-wide scheduler lock without blocking; False if another worker holds it"""
+        lock_file = _try_flock(SCHEDULER_LOCK_PATH)
+        if lock_file is False:
+            return False
+        
+        self.leader_lock_file = lock_file
+        return True
+    
+    def _release_leader_lock(self):
+        if self.leader_lock_file:
+            self.leader_lock_file.close()
+            self.leader_lock_file = None
+    
     def start_scheduler(self):
         """Start the daily email processing scheduler"""
         if self.is_running:
             logger.warning("Scheduler is already running")
             return
         
+        # With `uvicorn --workers N` every worker runs the startup hook; only one may schedule
+        if not self._acquire_leader_lock():
+            logger.info("Scheduler already running in another worker, not starting it here")
+            return
+        
         logger.info("Starting DMARC email processing scheduler")
         
         # Schedule daily processing at 2:00 AM
@@ -195,6 +267,7 @@ class DmarcScheduler:
             self.scheduler_thread.join(timeout=5)
         
         schedule.clear()
+        self._release_leader_lock()
         logger.info("Scheduler stopped")
     
     def run_now(self):
@@ -202,6 +275,24 @@ class DmarcScheduler:
         logger.info("Manually triggering DMARC email processing")
         self.run_daily_processing()
 
+def _try_flock(path: str):
+    """
+    Take a host-wide exclusive lock on path without blocking
+    Returns the open handle holding it, None without fcntl, or False if another process holds it
+    """
+    if fcntl is None:
+        return None
+    
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    
+    # The lock lives as long as this handle (and dies with the process)
+    return lock_file
+
 # Global scheduler instance
 scheduler = DmarcScheduler()
 
@@ -0,0 +1,193 @@
+"""
+Shared fixtures: the API wired to an in-memory PostgREST stand-in
+Supabase clients keep their real query building; only the shared HTTP transport is replaced
+"""
+
+import asyncio
+import json
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+import api
+import auth
+import config
+import response_cache
+
+USER_ID = '11111111-1111-4111-8111-111111111111'
+OTHER_USER_ID = '22222222-2222-4222-8222-222222222222'
+
+# processing_jobs statuses covered by its partial unique index
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+class FakePostgrest:
+    """
+    Just enough of PostgREST for the endpoints under test: eq/in/lt/gt filters, or=(...)
+    with nested and(...), order, limit and inserts, over in-memory tables
+    """
+
+    def __init__(self):
+        self.tables = defaultdict(list)  # {table: [row]}
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        table = request.url.path.rsplit('/', 1)[-1]
+
+        if request.method == 'GET':
+            return httpx.Response(200, json=self._select(table, request.url.params.multi_items()))
+
+        if request.method == 'POST':
+            payload = json.loads(request.content)
+            rows = payload if isinstance(payload, list) else [payload]
+            inserted = []
+            for row in rows:
+                row = self._defaults(table, row)
+                if table == 'processing_jobs' and self._has_active_job(row):
+                    return httpx.Response(409, json={
+                        'code': '23505',
+                        'message': 'duplicate key value violates unique constraint "idx_processing_jobs_one_active"',
+                        'details': None,
+                        'hint': None
+                    })
+                inserted.append(row)
+            self.tables[table].extend(inserted)
+            return httpx.Response(201, json=inserted)
+
+        if request.method == 'PATCH':
+            rows = self._select(table, request.url.params.multi_items())
+            for row in rows:
+                row.update(json.loads(request.content))
+            return httpx.Response(200, json=rows)
+
+        raise AssertionError(f"Unexpected {request.method} {request.url}")
+
+    def table_requests(self, table: str, method: str = None) -> List[httpx.Request]:
+        return [
+            r for r in self.requests
+            if r.url.path.endswith('/' + table) and (method is None or r.method == method)
+        ]
+
+    def _select(self, table: str, params) -> List[Dict[str, Any]]:
+        rows = list(self.tables[table])
+        order, limit = None, None
+        for key, value in params:
+            if key == 'select':
+                continue
+            elif key == 'order':
+                order = value
+            elif key == 'limit':
+                limit = int(value)
+            elif key == 'or':
+                rows = [r for r in rows if self._match_group('or', value[1:-1], r)]
+            else:
+                rows = [r for r in rows if self._match(key, value, r)]
+
+        if order:
+            # Apply the least significant key first; Python's sort is stable
+            for term in reversed(order.split(',')):
+                column, _, direction = term.partition('.')
+                rows.sort(key=lambda r: _sort_key(r[column]), reverse=direction == 'desc')
+
+        return rows[:limit] if limit is not None else rows
+
+    def _match(self, column: str, condition: str, row: Dict[str, Any]) -> bool:
+        op, _, value = condition.partition('.')
+        value = value.strip('"')
+        if op == 'in':
+            return str(row[column]) in value[1:-1].split(',')
+        left, right = _sort_key(row[column]), _sort_key(value)
+        return {
+            'eq': left == right,
+            'lt': left < right,
+            'gt': left > right,
+        }[op]
+
+    def _match_group(self, kind: str, body: str, row: Dict[str, Any]) -> bool:
+        results = []
+        for term in _split_top_level(body):
+            if term.startswith(('and(', 'or(')):
+                inner_kind, _, inner = term.partition('(')
+                results.append(self._match_group(inner_kind, inner[:-1], row))
+            else:
+                column, _, condition = term.partition('.')
+                results.append(self._match(column, condition, row))
+        return any(results) if kind == 'or' else all(results)
+
+    def _defaults(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(row)
+        row.setdefault('id', str(uuid.uuid4()))
+        row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        if table == 'processing_jobs':
+            for column in ('result', 'error', 'started_at', 'heartbeat_at', 'finished_at'):
+                row.setdefault(column, None)
+        return row
+
+    def _has_active_job(self, row: Dict[str, Any]) -> bool:
+        return any(
+            job['user_id'] == row['user_id'] and job['kind'] == row['kind'] and job['status'] in ACTIVE_JOB_STATUSES
+            for job in self.tables['processing_jobs']
+        )
+
+def _split_top_level(body: str) -> List[str]:
+    """Split a PostgREST logic expression on commas outside parentheses and quotes"""
+    terms, depth, quoted, current = [], 0, False, ''
+    for char in body:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            terms.append(current)
+            current = ''
+            continue
+        current += char
+    terms.append(current)
+    return terms
+
+def _sort_key(value: Any) -> Any:
+    """Compare timestamps as instants, like timestamptz columns; anything else as text"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+class ApiClient:
+    """Synchronous wrapper around an in-process ASGI client"""
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async def send():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url='http://test') as client:
+                return await client.request(method, url, **kwargs)
+        return asyncio.run(send())
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request('POST', url, **kwargs)
+
+@pytest.fixture
+def fake_db(monkeypatch) -> FakePostgrest:
+    db = FakePostgrest()
+    monkeypatch.setattr(config._http_client, '_transport', httpx.MockTransport(db.handler))
+    return db
+
+@pytest.fixture(autouse=True)
+def fresh_response_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, '_response_cache_instance', None)
+
+@pytest.fixture
+def client(fake_db) -> ApiClient:
+    # No access_token: requests go out with the anon key, which the fake ignores
+    api.app.dependency_overrides[auth.get_current_user] = lambda: {'id': USER_ID, 'email': 'user@example.com'}
+    yield ApiClient()
+    api.app.dependency_overrides.clear()
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import api
+import config
+from jobs import create_job, STALE_JOB_AFTER
+
+from conftest import USER_ID, OTHER_USER_ID
+
+@pytest.fixture
+def started_jobs(monkeypatch):
+    """Job ids handed to the background runner, which is replaced so nothing is processed"""
+    started = []
+    monkeypatch.setattr(api, '_run_user_processing_job', lambda job_id, user: started.append(job_id))
+    return started
+
+def test_second_trigger_while_a_job_is_active_returns_the_same_job(client, fake_db, started_jobs):
+    first = client.post('/api/v1/user/trigger-my-processing')
+    second = client.post('/api/v1/user/trigger-my-processing')
+
+    assert first.status_code == 202
+    assert second.status_code == 202
+    assert second.json()['job_id'] == first.json()['job_id']
+    assert len(fake_db.tables['processing_jobs']) == 1
+    assert started_jobs == [first.json()['job_id']]
+
+def test_trigger_after_the_job_finished_starts_a_new_one(client, fake_db, started_jobs):
+    first = client.post('/api/v1/user/trigger-my-processing').json()
+    fake_db.tables['processing_jobs'][0]['status'] = 'completed'
+
+    second = client.post('/api/v1/user/trigger-my-processing').json()
+
+    assert second['job_id'] != first['job_id']
+    assert started_jobs == [first['job_id'], second['job_id']]
+
+def test_active_job_of_another_user_does_not_block(fake_db):
+    supabase = config.get_supabase_client()
+    other, _ = create_job(supabase, api.USER_PROCESSING_JOB, OTHER_USER_ID)
+
+    job, created = create_job(supabase, api.USER_PROCESSING_JOB, USER_ID)
+
+    assert created
+    assert job['job_id'] != other['job_id']
+
+def test_insert_race_returns_the_job_that_won(fake_db, monkeypatch):
+    supabase = config.get_supabase_client()
+    winner, _ = create_job(supabase, api.USER_PROCESSING_JOB, USER_ID)
+
+    # Simulate another worker inserting between our lookup and our insert: the first
+    # active-job lookup misses, the unique index rejects the insert
+    lookups = []
+    original_select = fake_db._select
+
+    def select(table, params):
+        rows = original_select(table, params)
+        if table == 'processing_jobs' and not lookups:
+            lookups.append(1)
+            return []
+        return rows
+
+    monkeypatch.setattr(fake_db, '_select', select)
+
+    job, created = create_job(supabase, api.USER_PROCESSING_JOB, USER_ID)
+
+    assert not created
+    assert job['job_id'] == winner['job_id']
+
+def test_stale_job_no_longer_blocks(fake_db, monkeypatch):
+    monkeypatch.setattr(config, 'SUPABASE_SERVICE_ROLE_KEY', None)  # stale job is marked failed through the anon client
+    supabase = config.get_supabase_client()
+    stale_since = (datetime.now(timezone.utc) - STALE_JOB_AFTER - timedelta(minutes=1)).isoformat()
+    fake_db.tables['processing_jobs'].append({
+        'id': 'b0000000-0000-4000-8000-000000000001',
+        'user_id': USER_ID,
+        'kind': api.USER_PROCESSING_JOB,
+        'status': 'running',
+        'result': None,
+        'error': None,
+        'created_at': stale_since,
+        'started_at': stale_since,
+        'heartbeat_at': stale_since,
+        'finished_at': None,
+    })
+
+    job, created = create_job(supabase, api.USER_PROCESSING_JOB, USER_ID)
+
+    assert created
+    assert job['job_id'] != 'b0000000-0000-4000-8000-000000000001'
+    patches = fake_db.table_requests('processing_jobs', 'PATCH')
+    assert len(patches) == 1
+    assert b'"failed"' in patches[0].content
@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import USER_ID, OTHER_USER_ID
+
+def _report(n: int, created_at: str, user_id: str = USER_ID):
+    return {'id': f'a0000000-0000-4000-8000-{n:012d}', 'user_id': user_id, 'created_at': created_at}
+
+def _all_pages(client, limit: int):
+    reports, cursor = [], None
+    while True:
+        params = {'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/api/v1/reports', params=params)
+        assert response.status_code == 200
+        page = response.json()
+        reports.extend(page['reports'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return reports
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 8])
+def test_paging_returns_every_report_once_across_created_at_ties(client, fake_db, limit):
+    # A batch ingested together shares created_at; page boundaries must fall inside it
+    tied = '2026-10-10T08:00:00.123456+00:00'
+    fake_db.tables['dmarc_reports'].extend([
+        _report(1, '2026-10-11T00:00:00+00:00'),
+        _report(2, tied),
+        _report(3, tied),
+        _report(4, tied),
+        _report(5, tied),
+        _report(6, tied),
+        _report(7, '2026-10-09T00:00:00+00:00'),
+        _report(8, tied, user_id=OTHER_USER_ID),
+    ])
+
+    ids = [r['id'] for r in _all_pages(client, limit)]
+
+    expected = [_report(n, '')['id'] for n in (1, 6, 5, 4, 3, 2, 7)]
+    assert ids == expected
+
+def test_last_full_page_is_followed_by_an_empty_one(client, fake_db):
+    fake_db.tables['dmarc_reports'].extend([
+        _report(1, '2026-10-10T00:00:00+00:00'),
+        _report(2, '2026-10-10T00:00:00+00:00'),
+    ])
+
+    first = client.get('/api/v1/reports', params={'limit': 2}).json()
+    last = client.get('/api/v1/reports', params={'limit': 2, 'cursor': first['next_cursor']}).json()
+
+    assert last == {'reports': [], 'next_cursor': None}
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    '2026-10-10T00:00:00+00:00|not-a-uuid',
+    'yesterday|a0000000-0000-4000-8000-000000000001',
+    '2026-10-10T00:00:00+00:00|a0000000-0000-4000-8000-000000000001|extra',
+])
+def test_invalid_cursor_is_rejected(client, fake_db, cursor):
+    response = client.get('/api/v1/reports', params={'limit': 2, 'cursor': cursor})
+
+    assert response.status_code == 400
+    assert fake_db.table_requests('dmarc_reports') == []
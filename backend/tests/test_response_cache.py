@@ -0,0 +1,65 @@
+from response_cache import ResponseCache, get_response_cache, ANALYTICS_SUMMARY, REPORTS_LIST
+
+from conftest import USER_ID, OTHER_USER_ID
+
+def test_invalidate_user_drops_only_that_users_entries():
+    cache = ResponseCache()
+    cache.set(REPORTS_LIST, USER_ID, {'reports': []})
+    cache.set(ANALYTICS_SUMMARY, USER_ID, {'total_reports': 0})
+    cache.set(REPORTS_LIST, OTHER_USER_ID, {'reports': []})
+
+    cache.invalidate_user(USER_ID)
+
+    assert cache.get(REPORTS_LIST, USER_ID) is None
+    assert cache.get(ANALYTICS_SUMMARY, USER_ID) is None
+    assert cache.get(REPORTS_LIST, OTHER_USER_ID) is not None
+
+def test_get_or_compute_only_computes_on_a_miss():
+    cache = ResponseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'reports': []}
+
+    first = cache.get_or_compute(REPORTS_LIST, USER_ID, compute)
+    second = cache.get_or_compute(REPORTS_LIST, USER_ID, compute)
+
+    assert first == second
+    assert len(calls) == 1
+
+def test_reports_list_is_served_from_cache_until_invalidated(client, fake_db):
+    fake_db.tables['dmarc_reports'].append({
+        'id': 'a0000000-0000-4000-8000-000000000001', 'user_id': USER_ID, 'created_at': '2026-10-01T00:00:00+00:00'
+    })
+
+    first = client.get('/api/v1/reports')
+    client.get('/api/v1/reports')
+    assert len(fake_db.table_requests('dmarc_reports')) == 1
+
+    get_response_cache().invalidate_user(USER_ID)
+    third = client.get('/api/v1/reports')
+
+    assert len(fake_db.table_requests('dmarc_reports')) == 2
+    assert first.json() == third.json()
+
+def test_matching_if_none_match_returns_304(client, fake_db):
+    first = client.get('/api/v1/reports')
+    etag = first.headers['etag']
+    assert first.status_code == 200
+    assert first.headers['cache-control'] == 'private, no-cache'
+
+    revalidated = client.get('/api/v1/reports', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b''
+    assert revalidated.headers['etag'] == etag
+
+    # Weak validators and lists of tags match too
+    weak = client.get('/api/v1/reports', headers={'If-None-Match': f'"stale", W/{etag}'})
+    assert weak.status_code == 304
+
+def test_stale_if_none_match_returns_the_body(client, fake_db):
+    response = client.get('/api/v1/reports', headers={'If-None-Match': '"stale"'})
+
+    assert response.status_code == 200
+    assert response.json() == {'reports': []}
@@ -31,13 +31,10 @@ export default function Overview({ session, setActiveTab }: OverviewProps) {
         const summary = await api.getAnalyticsSummary()
         setStats(summary)
         
-        // Fetch reports to get the latest report date
-        const reports = await api.getReports()
+        // Fetch only the newest report to get the latest report date
+        const { reports } = await api.getReportsPage(1)
         if (reports.length > 0) {
-          const latestReport = reports.sort((a, b) => 
-            new Date(b.created_at).getTime() - new Date(a.created_at).getTime()
-          )[0]
-          setLastReportDate(latestReport.created_at)
+          setLastReportDate(reports[0].created_at)
         }
         
       } catch (err) {
@@ -1,6 +1,6 @@
 'use client'
 
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Switch } from '@headlessui/react'
 import { InboxIcon, KeyIcon, BellIcon, UserIcon, PlusIcon, TrashIcon, PencilIcon } from '@heroicons/react/24/outline'
 import { api, handleApiError, type IMAPConfig } from '@/lib/api'
@@ -15,6 +15,14 @@ function classNames(...classes: string[]) {
   return classes.filter(Boolean).join(' ')
 }
 
+// New and edited configs are verified in the background; poll until the check finishes
+const VERIFICATION_POLL_INTERVAL_MS = 2000
+const VERIFICATION_POLL_ATTEMPTS = 30
+
+// Processing all configs runs as a background job on the server; poll it until it finishes
+const JOB_POLL_INTERVAL_MS = 3000
+const JOB_POLL_ATTEMPTS = 200
+
 export default function Settings({ session, profile }: SettingsProps) {
   const { signOut } = useAuth()
   const [loading, setLoading] = useState(false)
@@ -25,6 +33,7 @@ export default function Settings({ session, profile }: SettingsProps) {
   const [imapConfigs, setImapConfigs] = useState<IMAPConfig[]>([])
   const [showNewConfigForm, setShowNewConfigForm] = useState(false)
   const [editingConfig, setEditingConfig] = useState<IMAPConfig | null>(null)
+  const [processingAll, setProcessingAll] = useState(false)
   const [newConfig, setNewConfig] = useState({
     name: '',
     host: '',
@@ -35,16 +44,51 @@ export default function Settings({ session, profile }: SettingsProps) {
     folder: 'INBOX'
   })
 
+  const pollingConfigIds = useRef(new Set<string>())
+  const mounted = useRef(true)
+
   useEffect(() => {
+    mounted.current = true
     fetchImapConfigs()
+    return () => {
+      mounted.current = false
+    }
   }, [])
 
+  const pollConfigVerification = async (configId: string) => {
+    if (pollingConfigIds.current.has(configId)) {
+      return
+    }
+    pollingConfigIds.current.add(configId)
+    try {
+      for (let attempt = 0; attempt < VERIFICATION_POLL_ATTEMPTS && mounted.current; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, VERIFICATION_POLL_INTERVAL_MS))
+        if (!mounted.current) {
+          return
+        }
+        const config = await api.getImapConfig(configId)
+        setImapConfigs(configs => configs.map(c => (c.id === configId ? config : c)))
+        if (config.verification_status !== 'pending') {
+          return
+        }
+      }
+    } catch (err) {
+      // The config may have been deleted meanwhile; the list shows its last known state
+      console.error('Error polling IMAP config verification:', err)
+    } finally {
+      pollingConfigIds.current.delete(configId)
+    }
+  }
+
   const fetchImapConfigs = async () => {
     try {
       setConfigsLoading(true)
       setError(null)
       const configs = await api.getImapConfigs()
       setImapConfigs(configs)
+      configs
+        .filter(config => config.verification_status === 'pending')
+        .forEach(config => pollConfigVerification(config.id))
     } catch (err) {
       setError(handleApiError(err))
     } finally {
@@ -69,10 +113,15 @@ export default function Settings({ session, profile }: SettingsProps) {
           config.id === editingConfig.id ? updatedConfig : config
         ))
         setEditingConfig(null)
+        if (updatedConfig.verification_status === 'pending') {
+          // Connection settings changed, so the server is re-testing them
+          pollConfigVerification(updatedConfig.id)
+        }
       } else {
-        // Create new config
+        // Create new config; its connection is tested in the background
         const createdConfig = await api.createImapConfig(newConfig)
         setImapConfigs([...imapConfigs, createdConfig])
+        pollConfigVerification(createdConfig.id)
       }
       
       setShowNewConfigForm(false)
@@ -104,6 +153,46 @@ export default function Settings({ session, profile }: SettingsProps) {
     }
   }
 
+  const handleProcessAll = async () => {
+    try {
+      setProcessingAll(true)
+      const { job_id } = await api.triggerMyProcessing()
+
+      for (let attempt = 0; attempt < JOB_POLL_ATTEMPTS && mounted.current; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+        if (!mounted.current) {
+          return
+        }
+        const job = await api.getJob(job_id)
+        if (job.status === 'completed') {
+          const result = job.result
+          const failed = result?.results?.filter(r => r.status === 'error') ?? []
+          alert(
+            `${result?.message ?? 'Processing completed'}\n` +
+            `Configurations processed: ${result?.processed_configs ?? 0}\n` +
+            `Reports processed: ${result?.total_processed ?? 0}` +
+            failed.map(r => `\n${r.config_name}: ${r.error}`).join('')
+          )
+          fetchImapConfigs()
+          return
+        }
+        if (job.status === 'failed') {
+          alert(`Error: ${job.error}`)
+          return
+        }
+      }
+      if (mounted.current) {
+        alert('Processing is still running in the background. Check back later for new reports.')
+      }
+    } catch (err) {
+      alert(`Error: ${handleApiError(err)}`)
+    } finally {
+      if (mounted.current) {
+        setProcessingAll(false)
+      }
+    }
+  }
+
   const handleDeleteConfig = async (configId: string) => {
     if (!confirm('Are you sure you want to delete this IMAP configuration?')) {
       return
@@ -216,13 +305,22 @@ export default function Settings({ session, profile }: SettingsProps) {
               <InboxIcon className="h-5 w-5 mr-2" />
               IMAP Configurations
             </h3>
-            <button
-              onClick={() => setShowNewConfigForm(true)}
-              className="inline-flex items-center px-3 py-2 border border-transparent text-sm font-medium rounded-md text-white bg-blue-600 hover:bg-blue-700"
-            >
-              <PlusIcon className="h-4 w-4 mr-1" />
-              Add Configuration
-            </button>
+            <div className="flex space-x-2">
+              <button
+                onClick={handleProcessAll}
+                disabled={processingAll || !imapConfigs.some(config => config.is_active)}
+                className="inline-flex items-center px-3 py-2 border border-gray-300 shadow-sm text-sm font-medium rounded-md text-gray-700 bg-white hover:bg-gray-50 disabled:opacity-50"
+              >
+                {processingAll ? 'Processing...' : 'Process All Active'}
+              </button>
+              <button
+                onClick={() => setShowNewConfigForm(true)}
+                className="inline-flex items-center px-3 py-2 border border-transparent text-sm font-medium rounded-md text-white bg-blue-600 hover:bg-blue-700"
+              >
+                <PlusIcon className="h-4 w-4 mr-1" />
+                Add Configuration
+              </button>
+            </div>
           </div>
           <p className="mt-1 text-sm text-gray-500">
             Configure your email server settings to fetch DMARC reports automatically.
@@ -261,12 +359,25 @@ export default function Settings({ session, profile }: SettingsProps) {
                           }`}>
                             {config.is_active ? 'Active' : 'Inactive'}
                           </span>
+                          {config.verification_status === 'pending' && (
+                            <span className="ml-2 inline-flex px-2 py-1 text-xs font-medium bg-yellow-100 text-yellow-800 rounded-full">
+                              Verifying...
+                            </span>
+                          )}
+                          {config.verification_status === 'failed' && (
+                            <span className="ml-2 inline-flex px-2 py-1 text-xs font-medium bg-red-100 text-red-800 rounded-full">
+                              Verification failed
+                            </span>
+                          )}
                           {config.use_ssl && (
                             <span className="ml-2 inline-flex px-2 py-1 text-xs font-medium bg-blue-100 text-blue-800 rounded-full">
                               SSL
                             </span>
                           )}
                         </div>
+                        {config.verification_status === 'failed' && config.verification_error && (
+                          <p className="mt-1 text-sm text-red-600">{config.verification_error}</p>
+                        )}
                       </div>
                       <div className="flex space-x-2">
                         <button
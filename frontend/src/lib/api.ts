@@ -88,11 +88,36 @@ export interface IMAPConfig {
   use_ssl: boolean
   folder: string
   is_active: boolean
+  verification_status?: 'pending' | 'verified' | 'failed'
+  verification_error?: string | null
   last_polled_at?: string
   created_at: string
   updated_at: string
 }
 
+export interface ProcessingJob {
+  job_id: string
+  kind: string
+  status: 'queued' | 'running' | 'completed' | 'failed'
+  result: {
+    message: string
+    processed_configs: number
+    total_processed?: number
+    results?: Array<{
+      config_name: string
+      status: 'success' | 'error'
+      processed?: number
+      errors?: number
+      error?: string
+    }>
+  } | null
+  error: string | null
+  created_at: string
+  started_at: string | null
+  heartbeat_at: string | null
+  finished_at: string | null
+}
+
 export interface UserProfile {
   id: string
   email: string
@@ -112,7 +137,7 @@ export const api = {
   },
 
   // DMARC Parsing
-  async parseDmarc(xmlData: string): Promise<{
+  async parseDmarc(xmlData: string | Blob): Promise<{
     message: string;
     report_id: string;
     summary: {
@@ -123,9 +148,14 @@ export const api = {
       fail_count: number;
     };
   }> {
+    // Send the report as the raw body; gzip/zip files can be uploaded as-is
+    const contentType = typeof xmlData === 'string'
+      ? 'application/xml'
+      : xmlData.type || 'application/octet-stream'
     const response = await authenticatedFetch('/api/v1/parse-dmarc', {
       method: 'POST',
-      body: JSON.stringify({ xml_data: xmlData })
+      headers: { 'Content-Type': contentType },
+      body: xmlData
     })
     
     if (!response.ok) {
@@ -145,6 +175,22 @@ export const api = {
     return data.reports
   },
 
+  // One page of reports, newest first; pass next_cursor back to get the following page
+  async getReportsPage(limit: number, cursor?: string): Promise<{
+    reports: DMARCReport[];
+    next_cursor: string | null;
+  }> {
+    const params = new URLSearchParams({ limit: String(limit) })
+    if (cursor) {
+      params.set('cursor', cursor)
+    }
+    const response = await authenticatedFetch(`/api/v1/reports?${params}`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch reports: ${response.statusText}`)
+    }
+    return response.json()
+  },
+
   async getReport(reportId: string): Promise<DMARCReport & { records: DMARCRecord[] }> {
     const response = await authenticatedFetch(`/api/v1/reports/${reportId}`)
     if (!response.ok) {
@@ -214,6 +260,15 @@ export const api = {
     return data.config
   },
 
+  async getImapConfig(configId: string): Promise<IMAPConfig> {
+    const response = await authenticatedFetch(`/api/v1/imap-configs/${configId}`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch IMAP config: ${response.statusText}`)
+    }
+    const data = await response.json()
+    return data.config
+  },
+
   async updateImapConfig(configId: string, config: Partial<IMAPConfig>): Promise<IMAPConfig> {
     const response = await authenticatedFetch(`/api/v1/imap-configs/${configId}`, {
       method: 'PUT',
@@ -279,6 +334,36 @@ export const api = {
     }
     return response.json()
   },
+
+  // Processing of all the user's active configs runs in the background; poll getJob for the outcome
+  async triggerMyProcessing(): Promise<{ job_id: string; status: ProcessingJob['status'] }> {
+    const response = await authenticatedFetch('/api/v1/user/trigger-my-processing', {
+      method: 'POST',
+    })
+    if (!response.ok) {
+      // Try to extract detailed error message from response body
+      let errorMessage = `Failed to start processing: ${response.statusText}`
+      try {
+        const errorData = await response.json()
+        if (errorData.detail) {
+          errorMessage = `Failed to start processing: ${errorData.detail}`
+        }
+      } catch {
+        // If we can't parse the response body, use the statusText
+      }
+      throw new Error(errorMessage)
+    }
+    return response.json()
+  },
+
+  async getJob(jobId: string): Promise<ProcessingJob> {
+    const response = await authenticatedFetch(`/api/v1/jobs/${jobId}`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch job: ${response.statusText}`)
+    }
+    const data = await response.json()
+    return data.job
+  },
 }
 
 // Legacy functions for backward compatibility during transition
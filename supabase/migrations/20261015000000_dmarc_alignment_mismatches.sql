@@ -0,0 +1,39 @@
+-- Header-From / envelope-From mismatches for a user's domain, aggregated in the database
+-- so the analysis engine doesn't have to pull every record row to compare them.
+-- Returns at most p_limit pairs, most frequent first; total_mismatches carries the number
+-- of distinct mismatched pairs before the limit is applied.
+CREATE OR REPLACE FUNCTION public.dmarc_alignment_mismatches(
+    p_user_id uuid,
+    p_domain text,
+    p_cutoff timestamptz,
+    p_limit integer DEFAULT 5
+)
+RETURNS TABLE (
+    header_from text,
+    envelope_from text,
+    message_count bigint,
+    total_mismatches bigint
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    SELECT
+        rec.header_from,
+        rec.envelope_from,
+        SUM(rec.count)::bigint AS message_count,
+        COUNT(*) OVER ()::bigint AS total_mismatches
+    FROM public.dmarc_records rec
+    JOIN public.dmarc_reports rep ON rep.id = rec.report_id
+    WHERE rep.user_id = p_user_id
+      AND rep.domain = p_domain
+      AND rep.created_at >= p_cutoff
+      AND rec.header_from IS NOT NULL AND rec.header_from <> ''
+      AND rec.envelope_from IS NOT NULL AND rec.envelope_from <> ''
+      AND rec.header_from <> rec.envelope_from
+    GROUP BY rec.header_from, rec.envelope_from
+    ORDER BY message_count DESC, rec.header_from, rec.envelope_from
+    LIMIT p_limit;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.dmarc_alignment_mismatches(uuid, text, timestamptz, integer) TO authenticated;
@@ -0,0 +1,30 @@
+-- Report totals for a user's domain over an analysis window, returned as a single row so
+-- the analysis engine doesn't have to fetch and sum every report. reports_hash digests the
+-- sorted report IDs and changes whenever a report enters or leaves the window.
+CREATE OR REPLACE FUNCTION public.dmarc_report_totals(
+    p_user_id uuid,
+    p_domain text,
+    p_cutoff timestamptz
+)
+RETURNS TABLE (
+    report_count bigint,
+    total_records bigint,
+    total_failures bigint,
+    reports_hash text
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    SELECT
+        COUNT(*)::bigint AS report_count,
+        COALESCE(SUM(rep.total_records), 0)::bigint AS total_records,
+        COALESCE(SUM(rep.fail_count), 0)::bigint AS total_failures,
+        md5(COALESCE(string_agg(rep.id::text, ',' ORDER BY rep.id::text), '')) AS reports_hash
+    FROM public.dmarc_reports rep
+    WHERE rep.user_id = p_user_id
+      AND rep.domain = p_domain
+      AND rep.created_at >= p_cutoff;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.dmarc_report_totals(uuid, text, timestamptz) TO authenticated;
@@ -0,0 +1,23 @@
+-- Dashboard totals for a user's DMARC reports as a single row, so the API doesn't fetch
+-- and sum every report. Runs as the caller, so RLS still scopes it to their own reports.
+CREATE OR REPLACE FUNCTION public.get_user_dmarc_summary(user_uuid uuid)
+RETURNS TABLE (
+    total_reports bigint,
+    total_records bigint,
+    pass_count bigint,
+    fail_count bigint
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    SELECT
+        COUNT(*)::bigint AS total_reports,
+        COALESCE(SUM(COALESCE(rep.total_records, 0)), 0)::bigint AS total_records,
+        COALESCE(SUM(COALESCE(rep.pass_count, 0)), 0)::bigint AS pass_count,
+        COALESCE(SUM(COALESCE(rep.fail_count, 0)), 0)::bigint AS fail_count
+    FROM public.dmarc_reports rep
+    WHERE rep.user_id = user_uuid;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.get_user_dmarc_summary(uuid) TO authenticated;
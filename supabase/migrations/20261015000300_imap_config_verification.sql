@@ -0,0 +1,13 @@
+-- IMAP connection checks run in the background after a config is saved. New configs start
+-- as 'pending' (and inactive) until the check marks them 'verified' or 'failed'.
+-- Existing configs were verified synchronously when created.
+ALTER TABLE public.imap_configs
+    ADD COLUMN IF NOT EXISTS verification_status text NOT NULL DEFAULT 'verified',
+    ADD COLUMN IF NOT EXISTS verification_error text;
+
+ALTER TABLE public.imap_configs
+    DROP CONSTRAINT IF EXISTS imap_configs_verification_status_check;
+
+ALTER TABLE public.imap_configs
+    ADD CONSTRAINT imap_configs_verification_status_check
+    CHECK (verification_status IN ('pending', 'verified', 'failed'));
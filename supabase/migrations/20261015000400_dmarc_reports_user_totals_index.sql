@@ -0,0 +1,5 @@
+-- Covering index for get_user_dmarc_summary: the per-user SUM/COUNT becomes an index-only
+-- scan instead of visiting every report row of the user in the heap.
+CREATE INDEX IF NOT EXISTS idx_dmarc_reports_user_totals
+    ON public.dmarc_reports (user_id)
+    INCLUDE (total_records, pass_count, fail_count);
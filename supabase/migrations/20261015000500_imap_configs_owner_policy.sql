@@ -0,0 +1,20 @@
+-- IMAP config updates/deletes no longer pre-select the row to check ownership: the mutation
+-- itself is filtered, and an empty result means "not found". Make sure RLS backs that up, so a
+-- write through a user's token can only ever touch that user's rows. The owner policy is only
+-- created when the table has no policies yet, to leave existing setups untouched.
+ALTER TABLE public.imap_configs ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_policies
+        WHERE schemaname = 'public' AND tablename = 'imap_configs'
+    ) THEN
+        CREATE POLICY imap_configs_owner ON public.imap_configs
+            FOR ALL
+            TO authenticated
+            USING (user_id = auth.uid())
+            WITH CHECK (user_id = auth.uid());
+    END IF;
+END
+$$;
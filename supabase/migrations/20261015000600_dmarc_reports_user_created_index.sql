@@ -0,0 +1,5 @@
+-- Serves the reports list (newest first) and its keyset pages: filtering by user and
+-- ordering by (created_at, id) DESC walks the index instead of sorting all of the user's
+-- reports. id breaks ties between reports stored with the same created_at.
+CREATE INDEX IF NOT EXISTS idx_dmarc_reports_user_created_id
+    ON public.dmarc_reports (user_id, created_at DESC, id DESC);
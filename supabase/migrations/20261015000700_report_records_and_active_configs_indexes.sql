@@ -0,0 +1,10 @@
+-- dmarc_records are always read per report and paged in id order (get_report, the NDJSON
+-- export, analysis), so (report_id, id) serves both the filter and the ORDER BY + range.
+CREATE INDEX IF NOT EXISTS idx_dmarc_records_report_id
+    ON public.dmarc_records (report_id, id);
+
+-- Manual and scheduled processing only read active configs; the partial index stays small
+-- and serves both the per-user lookup and the scheduler's scan of all active configs.
+CREATE INDEX IF NOT EXISTS idx_imap_configs_user_active
+    ON public.imap_configs (user_id)
+    WHERE is_active;
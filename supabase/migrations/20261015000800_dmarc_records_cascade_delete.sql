@@ -0,0 +1,26 @@
+-- Deleting a report removes its records in the same statement, so bulk report cleanup is a
+-- single DELETE (one round trip, one transaction) and can't leave orphaned records behind.
+-- The existing foreign key may not carry the default name, so drop whichever constraint
+-- links dmarc_records.report_id to dmarc_reports before adding the cascading one.
+DO $$
+DECLARE
+    fk record;
+BEGIN
+    FOR fk IN
+        SELECT c.conname
+        FROM pg_constraint c
+        JOIN pg_attribute a
+            ON a.attrelid = c.conrelid AND a.attnum = ANY (c.conkey)
+        WHERE c.contype = 'f'
+          AND c.conrelid = 'public.dmarc_records'::regclass
+          AND c.confrelid = 'public.dmarc_reports'::regclass
+          AND a.attname = 'report_id'
+    LOOP
+        EXECUTE format('ALTER TABLE public.dmarc_records DROP CONSTRAINT IF EXISTS %I', fk.conname);
+    END LOOP;
+END
+$$;
+
+ALTER TABLE public.dmarc_records
+    ADD CONSTRAINT dmarc_records_report_id_fkey
+    FOREIGN KEY (report_id) REFERENCES public.dmarc_reports (id) ON DELETE CASCADE;
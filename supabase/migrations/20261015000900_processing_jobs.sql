@@ -0,0 +1,35 @@
+-- Background processing jobs (user-triggered IMAP processing runs). Kept in the database
+-- rather than in API worker memory, so a poll can be answered by any worker and a run
+-- in flight on one worker is visible to the others.
+CREATE TABLE IF NOT EXISTS public.processing_jobs (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id uuid NOT NULL REFERENCES auth.users (id) ON DELETE CASCADE,
+    kind text NOT NULL,
+    status text NOT NULL DEFAULT 'queued',
+    result jsonb,
+    error text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    started_at timestamptz,
+    -- Refreshed by the running job; a stale heartbeat means its worker went away
+    heartbeat_at timestamptz,
+    finished_at timestamptz,
+    CONSTRAINT processing_jobs_status_check
+        CHECK (status IN ('queued', 'running', 'completed', 'failed'))
+);
+
+-- At most one queued/running job per user and kind: a second trigger on any worker
+-- conflicts here and gets the existing job back
+CREATE UNIQUE INDEX IF NOT EXISTS idx_processing_jobs_active
+    ON public.processing_jobs (user_id, kind)
+    WHERE status IN ('queued', 'running');
+
+-- Jobs are created and polled through the user's own token; the running job records its
+-- status with the service role, which bypasses RLS
+ALTER TABLE public.processing_jobs ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS processing_jobs_owner ON public.processing_jobs;
+CREATE POLICY processing_jobs_owner ON public.processing_jobs
+    FOR ALL
+    TO authenticated
+    USING (user_id = auth.uid())
+    WITH CHECK (user_id = auth.uid());
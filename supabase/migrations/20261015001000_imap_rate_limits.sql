@@ -0,0 +1,116 @@
+-- Shared IMAP rate limiting (RATE_LIMIT_BACKEND=database). Counters live here instead of in
+-- each API worker's memory, so limits hold across WEB_CONCURRENCY workers and the scheduler.
+-- Only the service role touches these tables and functions.
+CREATE TABLE IF NOT EXISTS public.imap_connection_attempts (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    user_id uuid NOT NULL,
+    attempted_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_imap_connection_attempts_user_time
+    ON public.imap_connection_attempts (user_id, attempted_at DESC);
+
+CREATE TABLE IF NOT EXISTS public.imap_rate_limit_state (
+    user_id uuid PRIMARY KEY,
+    failed_attempts integer NOT NULL DEFAULT 0,
+    blocked_until timestamptz
+);
+
+-- No policies: API users can't read or write the counters
+ALTER TABLE public.imap_connection_attempts ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.imap_rate_limit_state ENABLE ROW LEVEL SECURITY;
+
+-- Mirrors IMAPRateLimiter.is_rate_limited: an active backoff block first, then the
+-- per-minute and per-hour attempt windows
+CREATE OR REPLACE FUNCTION public.imap_rate_limit_check(
+    p_user_id uuid,
+    p_max_per_minute integer,
+    p_max_per_hour integer
+)
+RETURNS TABLE (is_limited boolean, reason text, retry_after integer)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_blocked_until timestamptz;
+    v_last_minute integer;
+    v_last_hour integer;
+BEGIN
+    SELECT s.blocked_until INTO v_blocked_until
+    FROM public.imap_rate_limit_state s
+    WHERE s.user_id = p_user_id;
+
+    IF v_blocked_until IS NOT NULL THEN
+        IF v_blocked_until > now() THEN
+            RETURN QUERY SELECT true, 'Too many failed authentication attempts'::text,
+                floor(extract(epoch FROM v_blocked_until - now()))::integer;
+            RETURN;
+        END IF;
+        -- Block has expired: failed attempts start over
+        DELETE FROM public.imap_rate_limit_state s WHERE s.user_id = p_user_id;
+    END IF;
+
+    SELECT count(*) FILTER (WHERE a.attempted_at > now() - interval '1 minute'), count(*)
+    INTO v_last_minute, v_last_hour
+    FROM public.imap_connection_attempts a
+    WHERE a.user_id = p_user_id AND a.attempted_at > now() - interval '1 hour';
+
+    IF v_last_minute >= p_max_per_minute THEN
+        RETURN QUERY SELECT true, 'Too many connection attempts per minute'::text, 60;
+    ELSIF v_last_hour >= p_max_per_hour THEN
+        RETURN QUERY SELECT true, 'Too many connection attempts per hour'::text, 3600;
+    ELSE
+        RETURN QUERY SELECT false, NULL::text, NULL::integer;
+    END IF;
+END
+$$;
+
+-- Mirrors IMAPRateLimiter.record_attempt. Returns the failed-attempt count (before the reset,
+-- for a success) and the backoff applied in seconds (0 if none).
+CREATE OR REPLACE FUNCTION public.imap_rate_limit_record(
+    p_user_id uuid,
+    p_success boolean,
+    p_max_failed integer,
+    p_backoff_base integer,
+    p_backoff_max integer
+)
+RETURNS TABLE (failed_attempts integer, blocked_seconds integer)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_failed integer;
+    v_backoff integer := 0;
+BEGIN
+    INSERT INTO public.imap_connection_attempts (user_id) VALUES (p_user_id);
+
+    -- Only the last hour is ever counted
+    DELETE FROM public.imap_connection_attempts a
+    WHERE a.user_id = p_user_id AND a.attempted_at < now() - interval '1 hour';
+
+    IF p_success THEN
+        DELETE FROM public.imap_rate_limit_state s
+        WHERE s.user_id = p_user_id
+        RETURNING s.failed_attempts INTO v_failed;
+        RETURN QUERY SELECT coalesce(v_failed, 0), 0;
+        RETURN;
+    END IF;
+
+    INSERT INTO public.imap_rate_limit_state AS s (user_id, failed_attempts)
+    VALUES (p_user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET failed_attempts = s.failed_attempts + 1
+    RETURNING s.failed_attempts INTO v_failed;
+
+    IF v_failed > p_max_failed THEN
+        v_backoff := least(p_backoff_base * (2 ^ least(v_failed - p_max_failed, 6))::integer, p_backoff_max);
+        UPDATE public.imap_rate_limit_state s
+        SET blocked_until = now() + make_interval(secs => v_backoff)
+        WHERE s.user_id = p_user_id;
+    END IF;
+
+    RETURN QUERY SELECT v_failed, v_backoff;
+END
+$$;
+
+REVOKE ALL ON FUNCTION public.imap_rate_limit_check(uuid, integer, integer) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.imap_rate_limit_record(uuid, boolean, integer, integer, integer) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.imap_rate_limit_check(uuid, integer, integer) TO service_role;
+GRANT EXECUTE ON FUNCTION public.imap_rate_limit_record(uuid, boolean, integer, integer, integer) TO service_role;
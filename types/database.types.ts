@@ -394,6 +394,8 @@ export type Database = {
           use_ssl: boolean | null
           user_id: string | null
           username: string
+          verification_error: string | null
+          verification_status: string
         }
         Insert: {
           created_at?: string | null
@@ -410,6 +412,8 @@ export type Database = {
           use_ssl?: boolean | null
           user_id?: string | null
           username: string
+          verification_error?: string | null
+          verification_status?: string
         }
         Update: {
           created_at?: string | null
@@ -426,6 +430,8 @@ export type Database = {
           use_ssl?: boolean | null
           user_id?: string | null
           username?: string
+          verification_error?: string | null
+          verification_status?: string
         }
         Relationships: [
           {